@@ -4,26 +4,43 @@ Flux Backend API - Cross-Currency Transaction Platform
 FastAPI-based backend with Firebase integration and quoting engine
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+import time
+# Import-time budget check: measured from here to the end of the module
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Header
 from pydantic import BaseModel
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 import asyncio
 import aiohttp
+import hashlib
 import json
+import math
+import sqlite3
+import threading
 import uuid
+import zlib
 from datetime import datetime
 import os
-import os
+from collections import OrderedDict, deque
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import quote, urlsplit
 from dotenv import load_dotenv
 from pathlib import Path
 import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from firebase_admin import credentials, auth
 import stripe
 
+# firebase_admin.firestore pulls in the whole Cloud Firestore client, so it is only
+# imported by initialize_firebase(); everything that uses it runs behind `if db`
+firestore = None
+
 
 def load_environment_variables() -> bool:
     """Load environment variables from known .env locations."""
@@ -39,31 +56,132 @@ def load_environment_variables() -> bool:
     return loaded_any
 
 
+# Module-level settings below are read from the environment, so .env is loaded first
 env_loaded = load_environment_variables()
 if not env_loaded:
     print("⚠️ No .env file found alongside backend; relying on existing environment variables")
 
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 stripe_enabled = False
-if STRIPE_SECRET_KEY:
-    try:
-        stripe.api_key = STRIPE_SECRET_KEY
-        stripe_enabled = True
-        print("✅ Stripe initialized")
-    except Exception as e:
-        print(f"Stripe initialization error: {e}")
 
-# Import our existing services
+# Budget for importing this module; exceeding it is logged and reported by /livez
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv('IMPORT_TIME_BUDGET_SECONDS', '2'))
+
+# Outbound HTTP pool settings
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '20'))
+HTTP_DNS_CACHE_TTL_SECONDS = int(os.getenv('HTTP_DNS_CACHE_TTL_SECONDS', '300'))
+HTTP_KEEPALIVE_TIMEOUT_SECONDS = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT_SECONDS', '30'))
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv('UPSTREAM_TIMEOUT_SECONDS', '10'))
+# Sent as a Bearer token on 1inch swap quotes when set
+ONEINCH_API_KEY = os.getenv('ONEINCH_API_KEY')
+
+# Quote fan-out deadlines
+QUOTE_CHAINS = ['polygon', 'zksync', 'arbitrum', 'optimism']
+CHAIN_QUOTE_TIMEOUT_SECONDS = float(os.getenv('CHAIN_QUOTE_TIMEOUT_SECONDS', '3'))
+QUOTE_DEADLINE_SECONDS = float(os.getenv('QUOTE_DEADLINE_SECONDS', '5'))
+BATCH_QUOTE_MAX_ITEMS = int(os.getenv('BATCH_QUOTE_MAX_ITEMS', '500'))
+# Concurrent quotes whose amounts agree to this many significant digits share one upstream fetch
+QUOTE_COALESCE_SIGNIFICANT_DIGITS = int(os.getenv('QUOTE_COALESCE_SIGNIFICANT_DIGITS', '3'))
+
+# Per-provider circuit breakers (fx, coinbase, 1inch)
+CIRCUIT_WINDOW_SIZE = int(os.getenv('CIRCUIT_WINDOW_SIZE', '20'))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', '5'))
+CIRCUIT_ERROR_RATE_THRESHOLD = float(os.getenv('CIRCUIT_ERROR_RATE_THRESHOLD', '0.5'))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', '2'))
+CIRCUIT_SLOW_RATE_THRESHOLD = float(os.getenv('CIRCUIT_SLOW_RATE_THRESHOLD', '0.5'))
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+
+# Hedged upstream GETs: duplicate a call still pending at the provider's latency percentile
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'true').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '0.95'))
+HEDGE_BUDGET_RATIO = float(os.getenv('HEDGE_BUDGET_RATIO', '0.05'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_LATENCY_WINDOW = int(os.getenv('HEDGE_LATENCY_WINDOW', '200'))
+
+# Hot corridors kept warm in the background, e.g. "USD:MXN,USD:EUR"
+WARM_CORRIDORS = [
+    tuple(corridor.strip().upper().split(':', 1))
+    for corridor in os.getenv('WARM_CORRIDORS', 'USD:MXN,USD:EUR').split(',')
+    if ':' in corridor
+]
+WARM_REFRESH_INTERVAL_SECONDS = float(os.getenv('WARM_REFRESH_INTERVAL_SECONDS', '15'))
+WARM_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv('WARM_SNAPSHOT_MAX_AGE_SECONDS', '45'))
+WARM_REFERENCE_AMOUNT = float(os.getenv('WARM_REFERENCE_AMOUNT', '1000'))
+
+# Verified ID token cache
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', '10000'))
+
+# Email -> uid lookup index
+EMAIL_UID_CACHE_TTL_SECONDS = float(os.getenv('EMAIL_UID_CACHE_TTL_SECONDS', '300'))
+EMAIL_UID_CACHE_MAX_ENTRIES = int(os.getenv('EMAIL_UID_CACHE_MAX_ENTRIES', '50000'))
+
+# /user/me profile cache; transfers invalidate both parties in this worker, the TTL bounds staleness elsewhere
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv('PROFILE_CACHE_TTL_SECONDS', '5'))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', '50000'))
+
+# Worker threads for blocking Firestore and Stripe calls
+BLOCKING_IO_WORKERS = int(os.getenv('BLOCKING_IO_WORKERS', '16'))
+
+# Transfer history paging
+HISTORY_DEFAULT_PAGE_SIZE = int(os.getenv('HISTORY_DEFAULT_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '100'))
+
+# Transfer batching and netting windows
+BATCH_WINDOW_SECONDS = float(os.getenv('BATCH_WINDOW_SECONDS', '60'))
+BATCH_WINDOW_MAX_TRANSFERS = int(os.getenv('BATCH_WINDOW_MAX_TRANSFERS', '50'))
+# Combined on-ramp + DEX cost per unit of volume that netting avoids
+BATCH_LEG_COST_RATE = float(os.getenv('BATCH_LEG_COST_RATE', '0.002'))
+BATCH_SAVINGS_HISTORY = int(os.getenv('BATCH_SAVINGS_HISTORY', '50'))
+
+# FX rate table cache
+FX_RATE_CACHE_TTL_SECONDS = float(os.getenv('FX_RATE_CACHE_TTL_SECONDS', '60'))
+FX_PIVOT_CURRENCY = os.getenv('FX_PIVOT_CURRENCY', 'USD').upper()
+
+# Quote store limits
+QUOTE_TTL_SECONDS = float(os.getenv('QUOTE_TTL_SECONDS', '300'))
+QUOTE_STORE_MAX_ENTRIES = int(os.getenv('QUOTE_STORE_MAX_ENTRIES', '10000'))
+QUOTE_SWEEP_INTERVAL_SECONDS = float(os.getenv('QUOTE_SWEEP_INTERVAL_SECONDS', '30'))
+# 'memory' keeps quotes per process; 'sqlite' shares them across uvicorn workers
+QUOTE_STORE_BACKEND = os.getenv('QUOTE_STORE_BACKEND', 'memory').lower()
+QUOTE_STORE_PATH = os.getenv('QUOTE_STORE_PATH', str(Path(__file__).resolve().parent / 'warp_store.sqlite3'))
+
+# Idempotent transfer execution
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '100000'))
+# How long an in-flight marker blocks retries if its worker dies mid-transfer. The owner refreshes
+# it every third of this while settling; keep it above the slowest Stripe + Firestore settlement
+IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS', '300'))
+
+# Asynchronous transfer settlement (durable local queue + worker pool)
+TRANSFER_QUEUE_PATH = os.getenv('TRANSFER_QUEUE_PATH', str(Path(__file__).resolve().parent / 'warp_transfers.sqlite3'))
+TRANSFER_WORKERS = int(os.getenv('TRANSFER_WORKERS', '4'))
+TRANSFER_QUEUE_POLL_SECONDS = float(os.getenv('TRANSFER_QUEUE_POLL_SECONDS', '1'))
+# A claimed transfer not finished within this long (worker crashed) is handed to another worker
+TRANSFER_QUEUE_LEASE_SECONDS = float(os.getenv('TRANSFER_QUEUE_LEASE_SECONDS', '300'))
+# Finished (COMPLETED/FAILED) rows stay queryable through /transfer/status for this long
+TRANSFER_QUEUE_RETENTION_SECONDS = float(os.getenv('TRANSFER_QUEUE_RETENTION_SECONDS', '604800'))
+
+# WebSocket push of balance and transfer-status updates
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '32'))
+UPDATE_MAX_CONNECTIONS_PER_USER = int(os.getenv('UPDATE_MAX_CONNECTIONS_PER_USER', '20'))
+
+# Balance ledger: transfers append entries; compaction folds them into users/{uid}.balances
+LEDGER_COMPACTION_INTERVAL_SECONDS = float(os.getenv('LEDGER_COMPACTION_INTERVAL_SECONDS', '300'))
+# A sender with this many uncompacted entries is compacted right after their transfer
+LEDGER_COMPACTION_THRESHOLD = int(os.getenv('LEDGER_COMPACTION_THRESHOLD', '50'))
+# Entries folded per compaction transaction (Firestore allows 500 writes per transaction)
+LEDGER_COMPACTION_BATCH = int(os.getenv('LEDGER_COMPACTION_BATCH', '400'))
+
+# Our existing services (imported when first used)
 import sys
 sys.path.append('..')
-from cex_integration import CEXAggregatorService
-from dex_aggregator import DEXAggregatorService
-from enhanced_fx_platform import FXRateService
 
 # Initialize Firebase Admin SDK
 def initialize_firebase():
     """Initialize Firebase Admin SDK"""
+    global firestore
     try:
+        from firebase_admin import firestore
         # Check if Firebase is already initialized
         if not firebase_admin._apps:
             # Initialize with service account key
@@ -74,13 +192,158 @@ def initialize_firebase():
         print(f"Firebase initialization error: {e}")
         return None
 
-# Initialize Firebase
-db = initialize_firebase()
+def initialize_stripe() -> bool:
+    """Configure the Stripe API key"""
+    if not STRIPE_SECRET_KEY:
+        return False
+    try:
+        stripe.api_key = STRIPE_SECRET_KEY
+        print("✅ Stripe initialized")
+        return True
+    except Exception as e:
+        print(f"Stripe initialization error: {e}")
+        return False
+
+# Firestore client, set up by the app lifespan
+db = None
+app_ready = False
+
+
+class UpstreamSessionPool:
+    """Long-lived aiohttp sessions, one per upstream host, with keep-alive and DNS caching"""
+
+    def __init__(self, limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 dns_cache_ttl: int = HTTP_DNS_CACHE_TTL_SECONDS,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+                 request_timeout: float = UPSTREAM_TIMEOUT_SECONDS):
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session_for(self, url: str) -> aiohttp.ClientSession:
+        """Return the pooled session for the URL's host, creating it on first use"""
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+            self._sessions[host] = session
+        return session
+
+    async def close(self):
+        """Close every pooled session"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(session.close() for session in sessions if not session.closed),
+                             return_exceptions=True)
+
+
+# Shared outbound session pool (created in the app lifespan)
+upstream_sessions: Optional[UpstreamSessionPool] = None
+
+
+class BlockingIOExecutor:
+    """Bounded thread pool that keeps blocking Firestore and Stripe calls off the event loop"""
+
+    def __init__(self, max_workers: int = BLOCKING_IO_WORKERS):
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.completed = 0
+        self.running = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on a worker thread and await its result"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='warp-io')
+
+        def call():
+            with self._lock:
+                self.running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        with self._lock:
+            self.submitted += 1
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'running': self.running,
+                'queued': self.submitted - self.completed - self.running,
+                'completed': self.completed
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+blocking_io = BlockingIOExecutor()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize Firebase/Stripe and shared upstream resources on startup, release them on shutdown"""
+    global upstream_sessions, db, stripe_enabled, app_ready
+    stripe_enabled = initialize_stripe()
+    if db is None:
+        # Credential problems surface here, at startup, instead of at import
+        db = await blocking_io.run(initialize_firebase)
+    upstream_sessions = UpstreamSessionPool()
+    transfer_queue.wakeup = asyncio.Event()
+    quote_sweeper = asyncio.create_task(sweep_expired_quotes())
+    prewarmer = asyncio.create_task(corridor_prewarmer.run()) if corridor_prewarmer.corridors else None
+    batch_closer = asyncio.create_task(close_batch_windows())
+    transfer_workers = [asyncio.create_task(run_transfer_worker()) for _ in range(TRANSFER_WORKERS)]
+    ledger_compactor = asyncio.create_task(compact_ledgers()) if db else None
+    app_ready = True
+    try:
+        yield
+    finally:
+        app_ready = False
+        quote_sweeper.cancel()
+        if prewarmer:
+            prewarmer.cancel()
+        batch_closer.cancel()
+        if ledger_compactor:
+            ledger_compactor.cancel()
+        for worker in transfer_workers:
+            worker.cancel()
+        # Let in-flight settlements see the cancellation before the executor goes away
+        await asyncio.gather(*transfer_workers, return_exceptions=True)
+        # Drain queued executor calls first; they may still be using the queue connection
+        blocking_io.shutdown()
+        transfer_queue.close()
+        quote_store.close()
+        idempotency_store.close()
+        await upstream_sessions.close()
+        upstream_sessions = None
+
 
 app = FastAPI(
     title="Warp API",
     description="Cross-Currency Transaction Platform with Firebase Integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for frontend access
@@ -90,6 +353,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Security scheme
@@ -97,11 +361,635 @@ security = HTTPBearer()
 
 # Initialize services
 fx_service = None  # FXRateService()
-cex_service = None  # CEXAggregatorService()
-dex_service = None  # DEXAggregatorService()
+cex_service = None  # AsyncCEXAggregatorService, created by get_cex_service() on first use
+dex_service = None  # DEXAggregatorService, created by get_dex_service() on first use
+
+class ExpiringStore:
+    """Interface for bounded key/value stores with a hard per-entry TTL"""
+
+    # True if calls can wait on disk or cross-process locks; async code then uses store_call()
+    blocking = False
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        raise NotImplementedError
+
+    def put_if_absent(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Store a value only if the key has no live entry; returns whether it was stored"""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def take(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Atomically remove a live entry; returns (value, remaining ttl seconds) or None"""
+        raise NotImplementedError
+
+    def replace_if(self, key: str, expected: Any, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Atomically overwrite a live entry only if it still holds `expected`; returns whether it did"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete_if(self, key: str, expected: Any) -> bool:
+        """Atomically remove an entry only if it still holds `expected`; returns whether it did"""
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InMemoryExpiringStore(ExpiringStore):
+    """Bounded LRU key/value store with a hard per-entry TTL"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Also touched from the blocking I/O worker threads
+        self._lock = threading.Lock()
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Store a value, evicting the least recently used entries when full"""
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._store(key, value, expires_at)
+
+    def put_if_absent(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Atomically claim a key unless it already holds a live value"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._store(key, value, now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds))
+            return True
+
+    def _store(self, key: str, value: Any, expires_at: float):
+        # Caller holds self._lock
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def take(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Remove and return a live value with its remaining TTL, or None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value, remaining
+
+    def replace_if(self, key: str, expected: Any, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Overwrite a live value (resetting its TTL) only if it still equals `expected`"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now or entry[1] != expected:
+                return False
+            self._store(key, value, now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds))
+            return True
+
+    def delete(self, key: str) -> bool:
+        """Remove a value, returning whether it was present"""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def delete_if(self, key: str, expected: Any) -> bool:
+        """Remove a value only if it still equals `expected`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != expected:
+                return False
+            del self._entries[key]
+            return True
+
+    def sweep(self) -> int:
+        """Drop every expired entry and return how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the store"""
+        return {
+            'backend': 'memory',
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+def serialize_payload(value: Any) -> bytes:
+    """Compact JSON, zlib-compressed"""
+    return zlib.compress(json.dumps(value, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def deserialize_payload(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob))
+
+
+def serialize_quote(quote: Dict[str, Any]) -> bytes:
+    """Serialize a cached quote without the copies of the routes and best path it carries"""
+    crypto_path = dict(quote.get('crypto_path') or {})
+    packed = dict(quote)
+    # crypto_path repeats the best path at its top level; keep only its key list under 'best_path'
+    best_path = crypto_path.get('best_path')
+    if isinstance(best_path, dict) and all(crypto_path.get(k) == v for k, v in best_path.items()):
+        crypto_path['best_path'] = {'$keys': list(best_path)}
+    if quote.get('route_options') is not None and quote.get('route_options') == crypto_path.get('routes'):
+        packed['route_options'] = '$routes'
+    if quote.get('on_ramp_details') is not None and quote.get('on_ramp_details') == crypto_path.get('on_ramp'):
+        packed['on_ramp_details'] = '$on_ramp'
+    packed['crypto_path'] = crypto_path
+    return serialize_payload(packed)
+
+
+def deserialize_quote(blob: bytes) -> Dict[str, Any]:
+    quote = deserialize_payload(blob)
+    crypto_path = quote.get('crypto_path') or {}
+    best_path = crypto_path.get('best_path')
+    if isinstance(best_path, dict) and '$keys' in best_path:
+        crypto_path['best_path'] = {key: crypto_path.get(key) for key in best_path['$keys']}
+    if quote.get('route_options') == '$routes':
+        quote['route_options'] = crypto_path.get('routes')
+    if quote.get('on_ramp_details') == '$on_ramp':
+        quote['on_ramp_details'] = crypto_path.get('on_ramp')
+    return quote
+
+
+class SQLiteExpiringStore(ExpiringStore):
+    """Expiring LRU store in a WAL-mode SQLite file, shared by every worker on the host"""
+
+    # Writers from other workers can hold the file lock for up to the 5s busy timeout
+    blocking = True
+
+    def __init__(self, path: str, namespace: str, ttl_seconds: float, max_entries: int,
+                 serializer=serialize_payload, deserializer=deserialize_payload):
+        self.path = path
+        self.table = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.serializer = serializer
+        self.deserializer = deserializer
+        # Counters are per process; size is shared. Updated under self._lock, in the same
+        # section as the statement they count
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Row count as this process last saw it plus its own inserts since; None until counted
+        self._size_estimate: Optional[int] = None
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened lazily so a closed store reconnects on next use
+        if self._connection is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expires ON {self.table} (expires_at)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+            self._connection = conn
+        return self._connection
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        blob = self.serializer(value)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, blob, expires_at, now)
+            )
+            self._note_insert()
+
+    def put_if_absent(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        blob = self.serializer(value)
+        with self._lock:
+            expired = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?", (key, now)
+            ).rowcount
+            self.expirations += expired
+            # The primary key makes this the atomic claim, across worker processes too
+            inserted = self._conn.execute(
+                f"INSERT OR IGNORE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, blob, expires_at, now)
+            ).rowcount > 0
+            if inserted:
+                self._note_insert()
+        return inserted
+
+    def _note_insert(self):
+        # Caller holds self._lock. Other workers' inserts only show up when the table is
+        # recounted, which happens once the estimate passes max_entries and on every sweep()
+        if self._size_estimate is None:
+            self._evict_overflow()
+            return
+        self._size_estimate += 1
+        if self._size_estimate > self.max_entries:
+            self._evict_overflow()
+
+    def _evict_overflow(self):
+        # Caller holds self._lock. A full store is trimmed to 90% of max_entries so the
+        # recount and delete run once per tenth of capacity, not on every insert
+        size = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if size > self.max_entries:
+            overflow = size - int(self.max_entries * 0.9)
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+            size -= overflow
+        self._size_estimate = size
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            blob, expires_at = row
+            if expires_at <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return self.deserializer(blob)
+
+    def take(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            # One statement, so two workers can't both take the same entry
+            row = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ? RETURNING value, expires_at", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            blob, expires_at = row
+            if expires_at <= now:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self.deserializer(blob), expires_at - now
+
+    def replace_if(self, key: str, expected: Any, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            # Serialization is deterministic, so comparing blobs keeps this one atomic statement
+            cursor = self._conn.execute(
+                f"UPDATE {self.table} SET value = ?, expires_at = ?, accessed_at = ? "
+                "WHERE key = ? AND value = ? AND expires_at > ?",
+                (self.serializer(value), expires_at, now, key, self.serializer(expected), now)
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def delete_if(self, key: str, expected: Any) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ? AND value = ?", (key, self.serializer(expected))
+            )
+        return cursor.rowcount > 0
+
+    def sweep(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+            self.expirations += cursor.rowcount
+            self._evict_overflow()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            return {
+                'backend': 'sqlite',
+                'size': size,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def create_expiring_store(namespace: str, ttl_seconds: float, max_entries: int,
+                          serializer=serialize_payload, deserializer=deserialize_payload) -> ExpiringStore:
+    """Build a store on the configured backend (QUOTE_STORE_BACKEND)"""
+    if QUOTE_STORE_BACKEND == 'sqlite':
+        return SQLiteExpiringStore(QUOTE_STORE_PATH, namespace, ttl_seconds, max_entries,
+                                   serializer=serializer, deserializer=deserializer)
+    if QUOTE_STORE_BACKEND != 'memory':
+        print(f"⚠️ Unknown QUOTE_STORE_BACKEND '{QUOTE_STORE_BACKEND}', using in-memory store")
+    return InMemoryExpiringStore(ttl_seconds, max_entries)
+
+
+async def store_call(method: Callable, *args) -> Any:
+    """Call an ExpiringStore method from async code, on blocking_io if the store can block"""
+    if method.__self__.blocking:
+        return await blocking_io.run(method, *args)
+    return method(*args)
+
+
+# Bounded, expiring quote store
+quote_store = create_expiring_store('quotes', QUOTE_TTL_SECONDS, QUOTE_STORE_MAX_ENTRIES,
+                                    serializer=serialize_quote, deserializer=deserialize_quote)
+
+# Idempotency-Key markers and completed /transfer/execute responses
+idempotency_store = create_expiring_store('idempotency', IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_ENTRIES)
+
+
+class TransferQueue:
+    """Durable FIFO of accepted transfers in a local WAL-mode SQLite file
+
+    Rows move QUEUED -> PROCESSING -> COMPLETED/FAILED. A PROCESSING row whose lease has run
+    out (its worker died) is claimed again, so settlement must be safe to repeat.
+    Methods block (up to the busy timeout); call them through blocking_io from async code.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = TRANSFER_QUEUE_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        # Set by the enqueuing request so idle workers in this process wake without waiting
+        # for their poll; created by the lifespan on the serving event loop
+        self.wakeup: Optional[asyncio.Event] = None
 
-# In-memory quote cache (replace with Redis in production)
-quote_cache = {}
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL fsyncs every commit: a 202 has been sent and the quote consumed once enqueue returns
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transfer_queue ("
+                "transaction_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS transfer_queue_status ON transfer_queue (status, created_at)")
+            self._connection = conn
+        return self._connection
+
+    def enqueue(self, transaction_id: str, user_id: str, payload: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO transfer_queue (transaction_id, user_id, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'QUEUED', ?, ?)",
+                (transaction_id, user_id, json.dumps(payload, default=str), now, now)
+            )
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued (or abandoned) transfer, or None if there is nothing to do"""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so two workers can't claim the same row
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT transaction_id, user_id, payload, attempts FROM transfer_queue "
+                    "WHERE status = 'QUEUED' OR (status = 'PROCESSING' AND updated_at <= ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - self.lease_seconds,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE transfer_queue SET status = 'PROCESSING', attempts = attempts + 1, updated_at = ? "
+                        "WHERE transaction_id = ?",
+                        (now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        transaction_id, user_id, payload, attempts = row
+        return {'transaction_id': transaction_id, 'user_id': user_id,
+                'payload': json.loads(payload), 'attempts': attempts + 1}
+
+    def _finish(self, transaction_id: str, status: str, result: Optional[Dict[str, Any]], error: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE transfer_queue SET status = ?, result = ?, error = ?, updated_at = ? WHERE transaction_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), transaction_id)
+            )
+
+    def complete(self, transaction_id: str, result: Dict[str, Any]):
+        self._finish(transaction_id, 'COMPLETED', result, None)
+
+    def fail(self, transaction_id: str, error: str):
+        self._finish(transaction_id, 'FAILED', None, error)
+
+    def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, status, result, error, attempts, created_at, updated_at "
+                "FROM transfer_queue WHERE transaction_id = ?",
+                (transaction_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        user_id, status, result, error, attempts, created_at, updated_at = row
+        return {
+            'transaction_id': transaction_id,
+            'user_id': user_id,
+            'status': status,
+            'result': json.loads(result) if result else None,
+            'error': error,
+            'attempts': attempts,
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Delete finished transfers last updated more than older_than_seconds ago"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM transfer_queue WHERE status IN ('COMPLETED', 'FAILED') AND updated_at <= ?",
+                (time.time() - older_than_seconds,)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM transfer_queue GROUP BY status").fetchall()
+        return {status.lower(): count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+transfer_queue = TransferQueue(TRANSFER_QUEUE_PATH)
+
+
+class UpdateHub:
+    """Fans balance and transfer-status events out to each user's open WebSockets
+
+    Every connection owns a small bounded queue drained by its own sender task, so an
+    idle socket costs one parked task and publishing never waits on a slow client.
+
+    Subscribers are local to this worker process, and so are publishes: with more than one
+    uvicorn worker, an event reaches only the sockets connected to the worker that settled
+    the transfer. Push updates are complete only with a single worker; running several needs
+    a cross-process broker (e.g. Redis pub/sub) in front of publish().
+    """
+
+    def __init__(self, queue_size: int, max_connections_per_user: int):
+        self.queue_size = queue_size
+        self.max_connections_per_user = max_connections_per_user
+        self.published = 0
+        self.resyncs = 0
+        self._subscribers: Dict[str, set] = {}
+
+    def subscribe(self, user_id: str) -> Optional[asyncio.Queue]:
+        """Register a connection; None if the user already has too many open"""
+        queues = self._subscribers.setdefault(user_id, set())
+        if len(queues) >= self.max_connections_per_user:
+            return None
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        queues.add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event: Dict[str, Any]):
+        """Queue an event for every connection the user has open in this worker"""
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # A client this far behind refetches /user/me instead of replaying deltas
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({'type': 'resync'})
+                self.resyncs += 1
+            else:
+                queue.put_nowait(event)
+            self.published += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'users': len(self._subscribers),
+            'connections': sum(len(queues) for queues in self._subscribers.values()),
+            'published': self.published,
+            'resyncs': self.resyncs,
+            'queue_size': self.queue_size
+        }
+
+
+update_hub = UpdateHub(UPDATE_QUEUE_SIZE, UPDATE_MAX_CONNECTIONS_PER_USER)
+
+def publish_transfer_status(user_id: str, transaction_id: str, status: str, error: Optional[str] = None):
+    update_hub.publish(user_id, {
+        'type': 'transfer_status',
+        'transaction_id': transaction_id,
+        'status': status,
+        'error': error,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+async def sweep_expired_quotes():
+    """Periodically drop abandoned quotes, expired idempotency keys and old finished transfers
+    so the stores don't grow with traffic"""
+    while True:
+        await asyncio.sleep(QUOTE_SWEEP_INTERVAL_SECONDS)
+        removed = await store_call(quote_store.sweep)
+        if removed:
+            print(f"🧹 Swept {removed} expired quotes")
+        await store_call(idempotency_store.sweep)
+        try:
+            purged = await blocking_io.run(transfer_queue.purge, TRANSFER_QUEUE_RETENTION_SECONDS)
+            if purged:
+                print(f"🧹 Purged {purged} finished transfers")
+        except Exception as e:
+            # The queue file can stay locked past the busy timeout; try again next sweep
+            print(f"⚠️ Transfer queue purge failed: {e}")
 
 # Pydantic models
 class QuoteRequest(BaseModel):
@@ -123,6 +1011,20 @@ class QuoteResponse(BaseModel):
     processing_time_ms: int
     route_options: Optional[List[Dict[str, Any]]] = None
     on_ramp_details: Optional[Dict[str, Any]] = None
+    stage_timings_ms: Optional[Dict[str, float]] = None
+
+class BatchQuoteRequest(BaseModel):
+    quotes: List[QuoteRequest]
+
+class BatchQuoteItem(BaseModel):
+    index: int
+    quote: Optional[QuoteResponse] = None
+    error: Optional[str] = None
+
+class BatchQuoteResponse(BaseModel):
+    quotes: List[BatchQuoteItem]
+    processing_time_ms: int
+    upstream_lookups: Dict[str, int]
 
 class TransferExecuteRequest(BaseModel):
     quote_id: str
@@ -137,10 +1039,20 @@ class TransferExecuteResponse(BaseModel):
     stripe_payment_status: Optional[str] = None
     stripe_payment_client_secret: Optional[str] = None
 
+class TransferStatusResponse(BaseModel):
+    transaction_id: str
+    status: str  # QUEUED, PROCESSING, COMPLETED or FAILED
+    attempts: int
+    queued_at: str
+    updated_at: str
+    error: Optional[str] = None
+    result: Optional[TransferExecuteResponse] = None
+
 class UserResponse(BaseModel):
     email: str
     display_name: str
     balances: Dict[str, float]
+    created_at: Optional[str] = None
 
 class TransactionResponse(BaseModel):
     transaction_id: str
@@ -153,6 +1065,12 @@ class TransactionResponse(BaseModel):
     rate: float
     timestamp: str
 
+# Verified claims keyed by token hash, each kept until its token's exp
+verified_token_cache = InMemoryExpiringStore(ttl_seconds=3600, max_entries=TOKEN_CACHE_MAX_ENTRIES)
+
+def token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
 # Authentication dependency
 async def verify_firebase_token(authorization: str = Header(None)):
     """Verify Firebase ID token"""
@@ -162,9 +1080,7 @@ async def verify_firebase_token(authorization: str = Header(None)):
     token = authorization.split(' ')[1]
     
     # Check if Firebase is initialized first (outside try block)
-    print(f"🔍 Firebase apps: {len(firebase_admin._apps)}")
     if not firebase_admin._apps:
-        print(f"⚠️  Firebase not initialized, using mock auth for token: {token[:50]}...")
         # Extract user info from JWT payload (for testing)
         import base64
         import json
@@ -191,42 +1107,454 @@ async def verify_firebase_token(authorization: str = Header(None)):
     
     # For testing purposes, accept mock token
     if token == 'mock-firebase-token-123':
-        print(f"✅ Mock token accepted: {token}")
         return {
             'uid': 'mock-user-123',
             'email': 'test@example.com',
             'displayName': 'Test User'
         }
     
+    # Repeat calls from the same session skip re-verification until the token expires
+    cache_key = token_cache_key(token)
+    cached_claims = verified_token_cache.get(cache_key)
+    if cached_claims is not None:
+        return cached_claims
+    
     try:
         # Real Firebase token verification
-        decoded_token = auth.verify_id_token(token)
-        return decoded_token
+        decoded_token = await blocking_io.run(auth.verify_id_token, token)
     except Exception as e:
         print(f"❌ Firebase auth error: {e}")
         print(f"❌ Token received: {token[:100]}...")
         raise HTTPException(status_code=401, detail="Invalid authentication token")
+    
+    remaining_seconds = decoded_token.get('exp', 0) - time.time()
+    if remaining_seconds > 0:
+        verified_token_cache.put(cache_key, decoded_token, ttl_seconds=remaining_seconds)
+    return decoded_token
+
+# Email -> uid index: user_emails/{normalized email} = {'uid': ...}, fronted by an in-process cache
+email_uid_cache = InMemoryExpiringStore(EMAIL_UID_CACHE_TTL_SECONDS, EMAIL_UID_CACHE_MAX_ENTRIES)
+
+def email_index_key(email: str) -> str:
+    """Normalized, document-id safe form of an email address"""
+    return quote(email.strip().lower(), safe='')
+
+def resolve_user_id_by_email(email: str) -> Optional[str]:
+    """Look up a user's uid by email via the cache, then the user_emails index"""
+    key = email_index_key(email)
+    user_id = email_uid_cache.get(key)
+    if user_id:
+        return user_id
+    
+    index_doc = db.collection('user_emails').document(key).get()
+    if index_doc.exists:
+        user_id = index_doc.to_dict().get('uid')
+    else:
+        # Users created before the index existed: query once, then backfill their entry
+        user_docs = list(db.collection('users').where('email', '==', email).limit(1).get())
+        if not user_docs:
+            return None
+        user_id = user_docs[0].id
+        db.collection('user_emails').document(key).set({'uid': user_id, 'email': email})
+    
+    if user_id:
+        email_uid_cache.put(key, user_id)
+    return user_id
 
 # Async HTTP client for API calls
-async def get_async_session():
-    return aiohttp.ClientSession()
+def get_async_session(url: str) -> aiohttp.ClientSession:
+    """Return the shared pooled session for an upstream URL"""
+    global upstream_sessions
+    if upstream_sessions is None:
+        # Outside the app lifespan (scripts, direct calls) the pool is created on demand
+        upstream_sessions = UpstreamSessionPool()
+    return upstream_sessions.session_for(url)
+
+class UpstreamHedger:
+    """Races a duplicate of a slow idempotent GET and keeps whichever answers first
+
+    The hedge fires once the original has been pending longer than the provider's recent
+    HEDGE_PERCENTILE latency. Hedges are capped at HEDGE_BUDGET_RATIO of all hedgeable calls
+    so a slow provider can't have its traffic doubled.
+    """
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 budget_ratio: float = HEDGE_BUDGET_RATIO, min_samples: int = HEDGE_MIN_SAMPLES,
+                 window_size: int = HEDGE_LATENCY_WINDOW):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies: Dict[str, deque] = {}
+
+    def threshold(self, provider: str) -> Optional[float]:
+        """Seconds after which a call to provider gets hedged, or None until there is enough history"""
+        samples = self._latencies.get(provider)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+
+    def _record(self, provider: str, seconds: float):
+        self._latencies.setdefault(provider, deque(maxlen=self.window_size)).append(seconds)
+
+    async def run(self, provider: str, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await make_call(), hedging it with a second make_call() if it runs long"""
+        self.calls += 1
+        delay = self.threshold(provider) if self.enabled else None
+        started = time.monotonic()
+        primary = asyncio.ensure_future(make_call())
+        tasks = [primary]
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+            if primary.done() or delay is None or self.hedged >= self.budget_ratio * self.calls:
+                result = await primary
+                self._record(provider, time.monotonic() - started)
+                return result
+            
+            self.hedged += 1
+            tasks.append(asyncio.ensure_future(make_call()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a successful answer; only surface an error once both attempts have failed
+                succeeded = [task for task in done if not task.exception()]
+                if succeeded:
+                    winner = succeeded[0]
+                    if winner is not primary:
+                        self.hedge_wins += 1
+                    self._record(provider, time.monotonic() - started)
+                    return winner.result()
+            return await primary
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'calls': self.calls,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'thresholds_ms': {
+                provider: round(threshold * 1000, 1)
+                for provider in self._latencies
+                if (threshold := self.threshold(provider)) is not None
+            }
+        }
+
+
+upstream_hedger = UpstreamHedger()
+
+def get_cex_service():
+    """Return the exchange service, importing and constructing it on first use"""
+    global cex_service
+    if cex_service is None:
+        from cex_integration import AsyncCEXAggregatorService
+        # Exchange I/O goes through the pooled sessions so it never blocks the event loop
+        cex_service = AsyncCEXAggregatorService(session_provider=get_async_session, hedger=upstream_hedger.run)
+    return cex_service
+
+def get_dex_service():
+    """Return the DEX chain registry, importing and constructing it on first use"""
+    global dex_service
+    if dex_service is None:
+        from dex_aggregator import DEXAggregatorService
+        dex_service = DEXAggregatorService()
+    return dex_service
+
+class UpstreamMetrics:
+    """Per-provider latency histograms and error counts, rendered in Prometheus text format"""
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # metric name -> label value -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[str, List[float]]] = {
+            'flux_upstream_latency_seconds': {},
+            'flux_quote_stage_seconds': {}
+        }
+        self.errors: Dict[str, int] = {}
+
+    def _observe(self, metric: str, label: str, seconds: float):
+        with self._lock:
+            series = self._histograms[metric].setdefault(label, [0] * (len(self.LATENCY_BUCKETS) + 2))
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def observe(self, provider: str, seconds: float, error: bool = False):
+        """Record one upstream call"""
+        self._observe('flux_upstream_latency_seconds', provider, seconds)
+        if error:
+            with self._lock:
+                self.errors[provider] = self.errors.get(provider, 0) + 1
+
+    def observe_stage(self, stage: str, seconds: float):
+        """Record one quote pipeline stage"""
+        self._observe('flux_quote_stage_seconds', stage, seconds)
+
+    def render(self, caches: Dict[str, Tuple[int, int]]) -> str:
+        """Prometheus exposition text; caches maps cache name to (hits, misses)"""
+        label_names = {'flux_upstream_latency_seconds': 'provider', 'flux_quote_stage_seconds': 'stage'}
+        lines: List[str] = []
+        with self._lock:
+            for metric, all_series in self._histograms.items():
+                label = label_names[metric]
+                lines.append(f"# TYPE {metric} histogram")
+                for value, series in sorted(all_series.items()):
+                    for bound, bucket_count in zip(self.LATENCY_BUCKETS, series):
+                        lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {bucket_count}')
+                    lines.append(f'{metric}_bucket{{{label}="{value}",le="+Inf"}} {series[-1]}')
+                    lines.append(f'{metric}_sum{{{label}="{value}"}} {series[-2]}')
+                    lines.append(f'{metric}_count{{{label}="{value}"}} {series[-1]}')
+            lines.append("# TYPE flux_upstream_errors_total counter")
+            for provider, count in sorted(self.errors.items()):
+                lines.append(f'flux_upstream_errors_total{{provider="{provider}"}} {count}')
+        lines.append("# TYPE flux_cache_requests_total counter")
+        for cache, (hits, misses) in caches.items():
+            lines.append(f'flux_cache_requests_total{{cache="{cache}",result="hit"}} {hits}')
+            lines.append(f'flux_cache_requests_total{{cache="{cache}",result="miss"}} {misses}')
+        lines.append("# TYPE flux_cache_hit_ratio gauge")
+        for cache, (hits, misses) in caches.items():
+            ratio = hits / (hits + misses) if hits + misses else 0
+            lines.append(f'flux_cache_hit_ratio{{cache="{cache}"}} {ratio}')
+        return "\n".join(lines) + "\n"
+
+
+upstream_metrics = UpstreamMetrics()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Trips on a provider's recent error or slow-call rate so callers fail fast to their fallbacks
+
+    closed: calls pass and outcomes fill a sliding window. open: calls are rejected until
+    open_seconds pass. half_open: a single probe call is let through; success closes the
+    breaker, failure re-opens it.
+    """
+
+    def __init__(self, name: str, window_size: int = CIRCUIT_WINDOW_SIZE, min_calls: int = CIRCUIT_MIN_CALLS,
+                 error_rate_threshold: float = CIRCUIT_ERROR_RATE_THRESHOLD,
+                 slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS,
+                 slow_rate_threshold: float = CIRCUIT_SLOW_RATE_THRESHOLD,
+                 open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probe_in_flight = False
+        # (succeeded, slow) per recent call
+        self._outcomes: deque = deque(maxlen=window_size)
+
+    def before_call(self) -> bool:
+        """Admit or reject a call; raises CircuitOpenError while open
+
+        Returns True if the admitted call is the half-open probe; pass it back to
+        release() or record() so only the probe's outcome decides recovery.
+        """
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = 'half_open'
+            print(f"🟡 {self.name} circuit half-open, probing")
+        if self.state == 'open' or (self.state == 'half_open' and self._probe_in_flight):
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit open")
+        if self.state == 'half_open':
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self, probe: bool):
+        """Forget an admitted call that was cancelled before it finished"""
+        if probe:
+            self._probe_in_flight = False
+
+    def record(self, succeeded: bool, seconds: float, probe: bool = False):
+        """Feed one finished call back into the breaker"""
+        slow = seconds >= self.slow_call_seconds
+        if probe:
+            self._probe_in_flight = False
+            if succeeded and not slow:
+                self.state = 'closed'
+                self._outcomes.clear()
+                print(f"🟢 {self.name} circuit closed")
+            else:
+                self._trip()
+            return
+        if self.state != 'closed':
+            # Admitted before the breaker tripped; it must not stand in for the probe
+            return
+        
+        self._outcomes.append((succeeded, slow))
+        if self.state == 'closed' and len(self._outcomes) >= self.min_calls:
+            error_rate = sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+            slow_rate = sum(1 for _, was_slow in self._outcomes if was_slow) / len(self._outcomes)
+            if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_rate_threshold:
+                self._trip()
+
+    def _trip(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        print(f"🔴 {self.name} circuit open for {self.open_seconds}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'trips': self.trips,
+            'rejected': self.rejected,
+            'window_errors': sum(1 for ok, _ in self._outcomes if not ok),
+            'window_calls': len(self._outcomes)
+        }
+
+
+circuit_breakers = {provider: CircuitBreaker(provider) for provider in ('fx', 'coinbase', '1inch')}
+
+
+@contextmanager
+def upstream_call(provider: str) -> Generator[Dict[str, bool], None, None]:
+    """Guard one upstream call with the provider's circuit breaker and record its latency
+
+    Raises CircuitOpenError without calling out while the breaker is open. An exception from
+    the body counts as a failure; the body can also set outcome['error'] for soft failures.
+    """
+    breaker = circuit_breakers[provider]
+    probe = breaker.before_call()
+    outcome = {'error': False}
+    started = time.monotonic()
+    cancelled = False
+    try:
+        yield outcome
+    except asyncio.CancelledError:
+        # Deadline cancellations say nothing about the provider's health
+        cancelled = True
+        breaker.release(probe)
+        raise
+    except Exception:
+        outcome['error'] = True
+        raise
+    finally:
+        if not cancelled:
+            elapsed = time.monotonic() - started
+            upstream_metrics.observe(provider, elapsed, error=outcome['error'])
+            breaker.record(not outcome['error'], elapsed, probe=probe)
+
+
+class StageTimer:
+    """Monotonic-clock timings for the stages of a single quote"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages: Dict[str, float] = {}
+
+    def record(self, stage: str, started: float):
+        elapsed = time.monotonic() - started
+        self.stages[stage] = round(elapsed * 1000, 3)
+        upstream_metrics.observe_stage(stage, elapsed)
+
+    @contextmanager
+    def stage(self, stage: str) -> Generator:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, started)
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+
+class RateTableCache:
+    """Process-wide cache of FX rate tables keyed by base currency, with single-flight refresh"""
+
+    def __init__(self, ttl_seconds: float = FX_RATE_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._tables: Dict[str, Tuple[float, Dict[str, float]]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get_table(self, base_currency: str) -> Dict[str, float]:
+        """Return the rate table for a base currency, fetching it at most once per TTL"""
+        base_currency = base_currency.upper()
+        cached = self._tables.get(base_currency)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        inflight = self._inflight.get(base_currency)
+        if inflight is None:
+            # Concurrent misses for the same base all await this one upstream request
+            inflight = asyncio.ensure_future(self._fetch_table(base_currency))
+            self._inflight[base_currency] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(base_currency, None))
+        # Shielded so a caller hitting its own deadline doesn't cancel the shared fetch
+        return await asyncio.shield(inflight)
+
+    async def _fetch_table(self, base_currency: str) -> Dict[str, float]:
+        url = f"https://api.exchangerate-api.com/v4/latest/{base_currency}"
+        with upstream_call('fx'):
+            data = await upstream_hedger.run('fx', lambda: self._get_json(url))
+        rates = data.get('rates', {})
+        self._tables[base_currency] = (time.monotonic(), rates)
+        return rates
+
+    @staticmethod
+    async def _get_json(url: str) -> Dict[str, Any]:
+        async with get_async_session(url).get(url) as response:
+            if response.status != 200:
+                raise Exception(f"FX API error: {response.status}")
+            return await response.json()
+
+
+fx_rate_cache = RateTableCache()
+
+
+def derive_cross_rate(table: Dict[str, float], base_currency: str,
+                      from_currency: str, to_currency: str) -> Optional[float]:
+    """Derive from→to from a rate table quoted against base_currency"""
+    from_rate = 1.0 if from_currency == base_currency else table.get(from_currency)
+    to_rate = 1.0 if to_currency == base_currency else table.get(to_currency)
+    if not from_rate or to_rate is None:
+        return None
+    return to_rate / from_rate
+
 
 async def call_fx_api(from_currency: str, to_currency: str) -> Dict:
-    """Call FX API asynchronously"""
+    """Call FX API asynchronously (served from the cached pivot rate table)"""
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://api.exchangerate-api.com/v4/latest/{from_currency}"
-            async with session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    rate = data.get('rates', {}).get(to_currency, 0)
-                    return {
-                        'rate': rate,
-                        'source': 'ExchangeRate API',
-                        'timestamp': datetime.now().isoformat()
-                    }
-                else:
-                    raise Exception(f"FX API error: {response.status}")
+        from_currency = from_currency.upper()
+        to_currency = to_currency.upper()
+        table = await fx_rate_cache.get_table(FX_PIVOT_CURRENCY)
+        rate = derive_cross_rate(table, FX_PIVOT_CURRENCY, from_currency, to_currency)
+        if rate is None:
+            # Currency missing from the pivot table; fall back to its own table
+            table = await fx_rate_cache.get_table(from_currency)
+            rate = table.get(to_currency, 0)
+        return {
+            'rate': rate,
+            'source': 'ExchangeRate API',
+            'timestamp': datetime.now().isoformat()
+        }
     except Exception as e:
         print(f"FX API error: {e}")
         # Fallback to simple rate
@@ -239,8 +1567,11 @@ async def call_fx_api(from_currency: str, to_currency: str) -> Dict:
 async def call_coinbase_api(amount: float, from_currency: str, to_crypto: str = "USDC") -> Dict:
     """Call Coinbase API for on-ramp cost"""
     try:
-        # Use our existing CEX service
-        quote = cex_service.coinbase.get_fiat_to_crypto_quote(amount, from_currency, to_crypto)
+        # Use our existing CEX service (asyncio-native client)
+        with upstream_call('coinbase') as outcome:
+            quote = await get_cex_service().coinbase.get_fiat_to_crypto_quote(amount, from_currency, to_crypto)
+            # The client swallows upstream failures and returns None
+            outcome['error'] = not quote
         if quote:
             return {
                 'crypto_amount': quote['crypto_amount'],
@@ -265,26 +1596,53 @@ async def call_coinbase_api(amount: float, from_currency: str, to_crypto: str =
             'timestamp': datetime.now().isoformat()
         }
 
+async def fetch_1inch_quote(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    headers = {'Authorization': f"Bearer {ONEINCH_API_KEY}"} if ONEINCH_API_KEY else None
+    async with get_async_session(url).get(url, params=params, headers=headers) as response:
+        if response.status != 200:
+            raise Exception(f"1inch API error: {response.status}")
+        return await response.json()
+
 async def call_1inch_api(crypto_amount: float, from_crypto: str, to_currency: str, chain: str = "polygon") -> Dict:
-    """Call 1inch API for DEX swap rates"""
+    """Call 1inch API for DEX swap rates
+
+    Quotes the chain's stablecoin swap (from_crypto into USDT, or DAI from USDT) and prices
+    the result in to_currency at the mid-market rate.
+    """
     try:
-        # Use our existing DEX service
-        chain_info = dex_service.get_chain_info(chain)
-        if chain_info:
-            # Simulate 1inch API call (replace with actual 1inch API integration)
-            # For demo purposes, we'll simulate a good DEX rate
-            fx_data = await call_fx_api("USD", to_currency)
-            dex_rate = fx_data['rate'] * 1.001  # 0.1% better than mid-market
-            
-            return {
-                'final_amount': crypto_amount * dex_rate,
-                'rate': dex_rate,
-                'chain': chain,
-                'source': '1inch API (Simulated)',
-                'timestamp': datetime.now().isoformat()
-            }
-        else:
+        dex = get_dex_service()
+        chain_info = dex.get_chain_info(chain)
+        if not chain_info:
             raise Exception(f"Unsupported chain: {chain}")
+        from_token = chain_info['usd_stablecoins'].get(from_crypto.upper())
+        to_symbol = 'DAI' if from_crypto.upper() == 'USDT' else 'USDT'
+        to_token = chain_info['usd_stablecoins'].get(to_symbol)
+        if not from_token or not to_token:
+            raise Exception(f"No {from_crypto}/{to_symbol} pair on {chain}")
+        # USDC and USDT use 6 decimals and DAI 18 on every configured chain
+        from_decimals, to_decimals = (6, 18) if to_symbol == 'DAI' else (6, 6)
+        from_units = int(crypto_amount * 10 ** from_decimals)
+        if from_units <= 0:
+            raise Exception(f"Amount too small to quote: {crypto_amount}")
+        url = f"{dex.apis['1inch']['base_url']}/{chain_info['chain_id']}/quote"
+        params = {'fromTokenAddress': from_token, 'toTokenAddress': to_token, 'amount': str(from_units)}
+        
+        # Only the 1inch request counts against its breaker; the FX lookup below has its own
+        with upstream_call('1inch'):
+            data = await upstream_hedger.run('1inch', lambda: fetch_1inch_quote(url, params))
+        to_units = int(data.get('toTokenAmount') or data['toAmount'])
+        swap_rate = (to_units / 10 ** to_decimals) / (from_units / 10 ** from_decimals)
+        
+        fx_data = await call_fx_api("USD", to_currency)
+        dex_rate = swap_rate * fx_data['rate']
+        
+        return {
+            'final_amount': crypto_amount * dex_rate,
+            'rate': dex_rate,
+            'chain': chain,
+            'source': '1inch API',
+            'timestamp': datetime.now().isoformat()
+        }
     except Exception as e:
         print(f"1inch API error: {e}")
         # Fallback
@@ -297,8 +1655,134 @@ async def call_1inch_api(crypto_amount: float, from_crypto: str, to_currency: st
             'timestamp': datetime.now().isoformat()
         }
 
-def model_batching_savings(crypto_rate: float, amount: float) -> float:
+class TransferBatchingEngine:
+    """Collects executed transfers into per-corridor windows and nets opposite-direction flows
+
+    A window closes after BATCH_WINDOW_SECONDS or BATCH_WINDOW_MAX_TRANSFERS transfers. USD→MXN
+    and MXN→USD share a window; only the residual of the two directions goes through the on-ramp
+    and DEX legs, and the leg cost avoided on the netted volume is the batch's realized saving.
+
+    Windows, reports and savings rates live in this worker process's memory. With more than one
+    uvicorn worker each one nets only the transfers it settled, so netting and the realized
+    savings rate fed back into quotes are accurate only with a single worker. Each transfer is
+    submitted once, by the settle_transfer call that records it.
+    """
+
+    def __init__(self, window_seconds: float = BATCH_WINDOW_SECONDS,
+                 max_transfers: int = BATCH_WINDOW_MAX_TRANSFERS,
+                 leg_cost_rate: float = BATCH_LEG_COST_RATE,
+                 history_size: int = BATCH_SAVINGS_HISTORY):
+        self.window_seconds = window_seconds
+        self.max_transfers = max_transfers
+        self.leg_cost_rate = leg_cost_rate
+        self.history_size = history_size
+        # (currency_a, currency_b) sorted -> {'opened_at': ..., 'transfers': [...]}
+        self._windows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._reports: Dict[Tuple[str, str], deque] = {}
+        self.recent_reports: deque = deque(maxlen=history_size)
+
+    @staticmethod
+    def corridor_key(send_currency: str, receive_currency: str) -> Tuple[str, str]:
+        return tuple(sorted((send_currency.upper(), receive_currency.upper())))
+
+    def submit(self, send_currency: str, receive_currency: str, send_amount: float,
+               received_amount: float, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Add an executed transfer; returns the batch report if this closed the window"""
+        key = self.corridor_key(send_currency, receive_currency)
+        window = self._windows.setdefault(key, {'opened_at': time.monotonic(), 'transfers': []})
+        window['transfers'].append({
+            'transaction_id': transaction_id,
+            'send_currency': send_currency.upper(),
+            'send_amount': send_amount,
+            'received_amount': received_amount
+        })
+        if len(window['transfers']) >= self.max_transfers:
+            return self.flush(key)
+        return None
+
+    def flush_due(self) -> List[Dict[str, Any]]:
+        """Close every window that has been open for the full window period"""
+        now = time.monotonic()
+        due = [key for key, window in self._windows.items() if now - window['opened_at'] >= self.window_seconds]
+        return [self.flush(key) for key in due]
+
+    def flush(self, key: Tuple[str, str]) -> Dict[str, Any]:
+        """Net a window's flows and record the realized savings"""
+        window = self._windows.pop(key)
+        base_currency, quote_currency = key
+        # Measure both directions in the base currency: what was sent for base→quote,
+        # what was received for quote→base
+        forward = sum(t['send_amount'] for t in window['transfers'] if t['send_currency'] == base_currency)
+        backward = sum(t['received_amount'] for t in window['transfers'] if t['send_currency'] != base_currency)
+        gross_volume = forward + backward
+        residual_volume = abs(forward - backward)
+        netted_volume = gross_volume - residual_volume
+        realized_savings = netted_volume * self.leg_cost_rate
+        report = {
+            'batch_id': str(uuid.uuid4()),
+            'corridor': f"{base_currency}/{quote_currency}",
+            'currency': base_currency,
+            'transfers': len(window['transfers']),
+            'gross_volume': gross_volume,
+            'netted_volume': netted_volume,
+            'residual_volume': residual_volume,
+            'residual_direction': (
+                f"{base_currency} → {quote_currency}" if forward >= backward else f"{quote_currency} → {base_currency}"
+            ),
+            'realized_savings': realized_savings,
+            'realized_savings_rate': (realized_savings / gross_volume) if gross_volume else 0,
+            'window_seconds': time.monotonic() - window['opened_at'],
+            'closed_at': datetime.now().isoformat()
+        }
+        self._reports.setdefault(key, deque(maxlen=self.history_size)).append(report)
+        self.recent_reports.append(report)
+        print(f"📦 Batch {report['corridor']}: {report['transfers']} transfers, "
+              f"netted {netted_volume:.2f} of {gross_volume:.2f} {base_currency}, "
+              f"residual {residual_volume:.2f} ({report['residual_direction']}) through on-ramp/DEX, "
+              f"saved {realized_savings:.2f} {base_currency}")
+        return report
+
+    def realized_savings_rate(self, send_currency: str, receive_currency: str) -> Optional[float]:
+        """Volume-weighted savings rate over the corridor's recent batches, or None without history"""
+        reports = self._reports.get(self.corridor_key(send_currency, receive_currency))
+        if not reports:
+            return None
+        gross_volume = sum(report['gross_volume'] for report in reports)
+        if not gross_volume:
+            return None
+        return sum(report['realized_savings'] for report in reports) / gross_volume
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'open_windows': {
+                f"{a}/{b}": len(window['transfers']) for (a, b), window in self._windows.items()
+            },
+            'realized_savings_rate': {
+                f"{a}/{b}": self.realized_savings_rate(a, b) for a, b in self._reports
+            },
+            'recent_batches': list(self.recent_reports)
+        }
+
+
+transfer_batching = TransferBatchingEngine()
+
+
+async def close_batch_windows():
+    """Close batching windows as they reach their time bound"""
+    while True:
+        await asyncio.sleep(min(BATCH_WINDOW_SECONDS, 1.0))
+        transfer_batching.flush_due()
+
+
+def model_batching_savings(crypto_rate: float, amount: float,
+                           send_currency: Optional[str] = None, receive_currency: Optional[str] = None) -> float:
     """Apply batching savings model to crypto rate"""
+    # Prefer what batching has actually realized on this corridor
+    if send_currency and receive_currency:
+        realized_rate = transfer_batching.realized_savings_rate(send_currency, receive_currency)
+        if realized_rate is not None:
+            return crypto_rate * (1 + realized_rate)
+    
     # Simulate batching savings based on amount
     if amount < 1000:
         savings_factor = 1.0  # No savings for small amounts
@@ -310,7 +1794,8 @@ def model_batching_savings(crypto_rate: float, amount: float) -> float:
     return crypto_rate * savings_factor
 
 
-def process_stripe_deposit(amount_usd: float, receiver_email: str, quote_id: str) -> Dict[str, Any]:
+def process_stripe_deposit(amount_usd: float, receiver_email: str, quote_id: str,
+                           idempotency_key: Optional[str] = None) -> Dict[str, Any]:
     """Create a Stripe PaymentIntent to simulate depositing funds into Stripe."""
     if not stripe_enabled:
         raise Exception("Stripe integration not configured")
@@ -331,7 +1816,9 @@ def process_stripe_deposit(amount_usd: float, receiver_email: str, quote_id: str
                 "receiver_email": receiver_email,
                 "quote_id": quote_id,
                 "source": "warp_transfer"
-            }
+            },
+            # A re-run settlement gets the original PaymentIntent back instead of charging twice
+            idempotency_key=idempotency_key
         )
         print(f"✅ Stripe deposit processed: {payment_intent.get('id')}")
         return payment_intent
@@ -339,61 +1826,111 @@ def process_stripe_deposit(amount_usd: float, receiver_email: str, quote_id: str
         print(f"❌ Stripe deposit error: {stripe_error}")
         raise
 
-async def find_best_crypto_path(amount: float, from_currency: str, to_currency: str) -> Dict:
-    """Find the best crypto path for the transaction"""
-    start_time = datetime.now()
+async def quote_chains(crypto_amount: float, to_currency: str, started: float,
+                       on_swap: Optional[Callable[[str, Dict], None]] = None,
+                       timer: Optional[StageTimer] = None) -> Tuple[Dict[str, Dict], List[str]]:
+    """Quote every chain concurrently; returns swaps in chain order plus the chains that timed out
+
+    on_swap, if given, is called with (chain, dex_swap) as soon as each chain answers; timer,
+    if given, records a chain.<name> stage for each chain that answers or times out.
+    """
+    timed_out_chains: List[str] = []
+    dex_swaps: Dict[str, Dict] = {}
     
-    # Step 1: Get on-ramp cost from Coinbase
-    print(f"🔍 Getting Coinbase on-ramp quote for {amount} {from_currency}...")
-    on_ramp = await call_coinbase_api(amount, from_currency, "USDC")
-    crypto_amount = on_ramp['crypto_amount']
+    async def quote_chain(chain: str) -> Dict:
+        print(f"🔗 Testing {chain} chain...")
+        chain_started = time.monotonic()
+        try:
+            dex_swap = await asyncio.wait_for(
+                call_1inch_api(crypto_amount, "USDC", to_currency, chain),
+                timeout=CHAIN_QUOTE_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            if timer:
+                timer.record(f"chain.{chain}", chain_started)
+            raise
+        if timer:
+            timer.record(f"chain.{chain}", chain_started)
+        if on_swap:
+            on_swap(chain, dex_swap)
+        return dex_swap
+    
+    chain_tasks = {chain: asyncio.create_task(quote_chain(chain)) for chain in QUOTE_CHAINS}
+    remaining = max(QUOTE_DEADLINE_SECONDS - (time.monotonic() - started), 0)
+    _, pending = await asyncio.wait(chain_tasks.values(), timeout=remaining)
+    for task in pending:
+        task.cancel()
+    
+    # Evaluate in chain order so route listings stay stable between requests
+    for chain, task in chain_tasks.items():
+        if task in pending:
+            print(f"⏱️ {chain} missed the {QUOTE_DEADLINE_SECONDS}s quote deadline")
+            timed_out_chains.append(chain)
+            continue
+        try:
+            dex_swaps[chain] = task.result()
+        except asyncio.TimeoutError:
+            print(f"⏱️ {chain} timed out after {CHAIN_QUOTE_TIMEOUT_SECONDS}s")
+            timed_out_chains.append(chain)
+        except Exception as e:
+            print(f"Error testing {chain}: {e}")
     
-    # Step 2: Test different chains for DEX swaps
-    chains = ['polygon', 'zksync', 'arbitrum', 'optimism']
+    return dex_swaps, timed_out_chains
+
+def scale_on_ramp(on_ramp: Dict, reference_amount: float, amount: float) -> Dict:
+    """Rescale an on-ramp quote taken for reference_amount to amount (on-ramp pricing is linear)"""
+    factor = (amount / reference_amount) if reference_amount else 0
+    return {**on_ramp, 'crypto_amount': on_ramp['crypto_amount'] * factor}
+
+def scale_dex_swaps(dex_swaps: Dict[str, Dict], reference_crypto_amount: float, crypto_amount: float) -> Dict[str, Dict]:
+    """Rescale per-chain swaps taken for reference_crypto_amount to crypto_amount"""
+    factor = (crypto_amount / reference_crypto_amount) if reference_crypto_amount else 0
+    return {chain: {**swap, 'final_amount': swap['final_amount'] * factor} for chain, swap in dex_swaps.items()}
+
+def build_route(amount: float, from_currency: str, to_currency: str, on_ramp: Dict,
+                chain: str, dex_swap: Dict) -> Dict[str, Any]:
+    """Describe a single on-ramp + chain swap route"""
+    final_amount = dex_swap['final_amount']
+    effective_rate = (final_amount / amount) if amount else 0
+    projected_batched_rate = model_batching_savings(effective_rate, amount, from_currency, to_currency)
+    return {
+        'chain': chain,
+        'path': f"{from_currency} → USDC ({on_ramp['source']}) → {to_currency} ({chain} via 1inch)",
+        'expected_final_amount': final_amount,
+        'effective_rate': effective_rate,
+        'projected_batched_amount': amount * projected_batched_rate,
+        'projected_batched_rate': projected_batched_rate,
+        'dex_rate': dex_swap['rate'],
+        'dex_source': dex_swap['source'],
+        'on_ramp_source': on_ramp['source'],
+        'on_ramp_rate': on_ramp['rate'],
+        'on_ramp_crypto_amount': on_ramp['crypto_amount']
+    }
+
+def build_crypto_path(amount: float, from_currency: str, to_currency: str, on_ramp: Dict,
+                      dex_swaps: Dict[str, Dict], timed_out_chains: List[str], processing_time: float) -> Dict:
+    """Rank the per-chain swaps and assemble the crypto path result"""
     best_path = None
     best_final_amount = 0
     routes: List[Dict[str, Any]] = []
     
-    for chain in chains:
-        print(f"🔗 Testing {chain} chain...")
-        try:
-            dex_swap = await call_1inch_api(crypto_amount, "USDC", to_currency, chain)
-            final_amount = dex_swap['final_amount']
-            effective_rate = (final_amount / amount) if amount else 0
-            projected_batched_rate = model_batching_savings(effective_rate, amount)
-            projected_batched_amount = amount * projected_batched_rate
-            route_info = {
+    for chain, dex_swap in dex_swaps.items():
+        route_info = build_route(amount, from_currency, to_currency, on_ramp, chain, dex_swap)
+        routes.append(route_info)
+        
+        final_amount = route_info['expected_final_amount']
+        if final_amount > best_final_amount:
+            best_final_amount = final_amount
+            best_path = {
                 'chain': chain,
-                'path': f"{from_currency} → USDC ({on_ramp['source']}) → {to_currency} ({chain} via 1inch)",
-                'expected_final_amount': final_amount,
-                'effective_rate': effective_rate,
-                'projected_batched_amount': projected_batched_amount,
-                'projected_batched_rate': projected_batched_rate,
-                'dex_rate': dex_swap['rate'],
-                'dex_source': dex_swap['source'],
-                'on_ramp_source': on_ramp['source'],
-                'on_ramp_rate': on_ramp['rate'],
-                'on_ramp_crypto_amount': crypto_amount
+                'on_ramp': on_ramp,
+                'dex_swap': dex_swap,
+                'final_amount': final_amount,
+                'path': route_info['path'],
+                'effective_rate': route_info['effective_rate'],
+                'projected_batched_rate': route_info['projected_batched_rate'],
+                'projected_batched_amount': route_info['projected_batched_amount']
             }
-            routes.append(route_info)
-            
-            if final_amount > best_final_amount:
-                best_final_amount = final_amount
-                best_path = {
-                    'chain': chain,
-                    'on_ramp': on_ramp,
-                    'dex_swap': dex_swap,
-                    'final_amount': final_amount,
-                    'path': route_info['path'],
-                    'effective_rate': effective_rate,
-                    'projected_batched_rate': projected_batched_rate,
-                    'projected_batched_amount': projected_batched_amount
-                }
-        except Exception as e:
-            print(f"Error testing {chain}: {e}")
-            continue
-    
-    processing_time = (datetime.now() - start_time).total_seconds() * 1000
     
     if best_path:
         for route in routes:
@@ -413,38 +1950,135 @@ async def find_best_crypto_path(amount: float, from_currency: str, to_currency:
             'path': best_path,
             'routes': routes,
             'on_ramp': on_ramp,
+            'timed_out_chains': timed_out_chains,
             'processing_time_ms': processing_time
         }
     else:
         return {
             'success': False,
             'error': 'No viable crypto path found',
+            'timed_out_chains': timed_out_chains,
             'processing_time_ms': processing_time
         }
 
-async def calculate_best_quote(send_currency: str, receive_currency: str, send_amount: float) -> QuoteResponse:
-    """Calculate the best quote using all available routes"""
-    start_time = datetime.now()
+async def fetch_crypto_path_inputs(amount: float, from_currency: str, to_currency: str,
+                                   timer: StageTimer) -> Tuple[Dict, Dict[str, Dict], List[str], float]:
+    """Fetch the on-ramp quote and per-chain swaps; returns them with the time taken in ms
+
+    The chain fan-out deadline runs from timer.started, when the quote request began, so
+    time spent on the FX and on-ramp calls counts against it.
+    """
+    started = time.monotonic()
     
-    print(f"🚀 Starting quote calculation: {send_amount} {send_currency} → {receive_currency}")
+    # Step 1: Get on-ramp cost from Coinbase
+    print(f"🔍 Getting Coinbase on-ramp quote for {amount} {from_currency}...")
+    with timer.stage('on_ramp'):
+        on_ramp = await call_coinbase_api(amount, from_currency, "USDC")
     
-    # Step 1: Asynchronously call FX API for mid-market rate
-    print("📡 Getting mid-market rate...")
-    fx_data = await call_fx_api(send_currency, receive_currency)
+    # Step 2: Test different chains for DEX swaps concurrently
+    with timer.stage('chain_fanout'):
+        dex_swaps, timed_out_chains = await quote_chains(on_ramp['crypto_amount'], to_currency, timer.started,
+                                                         timer=timer)
+    
+    return on_ramp, dex_swaps, timed_out_chains, (time.monotonic() - started) * 1000
+
+async def find_best_crypto_path(amount: float, from_currency: str, to_currency: str,
+                                timer: Optional[StageTimer] = None) -> Dict:
+    """Find the best crypto path for the transaction"""
+    on_ramp, dex_swaps, timed_out_chains, processing_time = await fetch_crypto_path_inputs(
+        amount, from_currency, to_currency, timer or StageTimer()
+    )
+    return build_crypto_path(amount, from_currency, to_currency, on_ramp, dex_swaps, timed_out_chains, processing_time)
+
+class QuoteCoalescer:
+    """Single-flight market data fetches for identical concurrent quotes
+
+    Requests for the same corridor whose amounts fall in the same bucket await one shared
+    fetch; each caller then rescales it to its own amount and gets its own quote_id.
+    """
+
+    def __init__(self, significant_digits: int = QUOTE_COALESCE_SIGNIFICANT_DIGITS):
+        self.significant_digits = significant_digits
+        self.leaders = 0
+        self.joined = 0
+        self._inflight: Dict[Tuple[str, str, float], asyncio.Future] = {}
+
+    def amount_bucket(self, amount: float) -> float:
+        """Round an amount to the configured number of significant digits"""
+        if amount <= 0:
+            return amount
+        return round(amount, self.significant_digits - 1 - math.floor(math.log10(amount)))
+
+    async def market_data(self, send_currency: str, receive_currency: str, amount: float,
+                          timer: StageTimer) -> Dict[str, Any]:
+        """Return FX, on-ramp and per-chain swap data priced at the bucket's first requested amount"""
+        key = (send_currency.upper(), receive_currency.upper(), self.amount_bucket(amount))
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            self.leaders += 1
+            inflight = asyncio.ensure_future(self._fetch(send_currency, receive_currency, amount, timer))
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # Shielded so the leader disconnecting doesn't fail the callers waiting on it
+            return await asyncio.shield(inflight)
+        
+        self.joined += 1
+        print(f"🤝 Joining in-flight quote for {amount} {send_currency} → {receive_currency}")
+        with timer.stage('coalesced_wait'):
+            return await asyncio.shield(inflight)
+
+    async def _fetch(self, send_currency: str, receive_currency: str, amount: float,
+                     timer: StageTimer) -> Dict[str, Any]:
+        # Step 1: Asynchronously call FX API for mid-market rate
+        print("📡 Getting mid-market rate...")
+        with timer.stage('fx'):
+            fx_data = await call_fx_api(send_currency, receive_currency)
+        
+        # Step 2: On-ramp and per-chain swaps for the crypto path
+        print("🪙 Finding best crypto path...")
+        with timer.stage('crypto_path'):
+            on_ramp, dex_swaps, timed_out_chains, fetch_time = await fetch_crypto_path_inputs(
+                amount, send_currency, receive_currency, timer
+            )
+        return {
+            'fx': fx_data,
+            'on_ramp': on_ramp,
+            'dex_swaps': dex_swaps,
+            'timed_out_chains': timed_out_chains,
+            'reference_amount': amount,
+            'fetch_time_ms': fetch_time
+        }
+
+    def price(self, market: Dict[str, Any], amount: float, send_currency: str, receive_currency: str) -> Dict:
+        """Scale shared market data to one caller's amount"""
+        on_ramp = scale_on_ramp(market['on_ramp'], market['reference_amount'], amount)
+        dex_swaps = scale_dex_swaps(market['dex_swaps'], market['on_ramp']['crypto_amount'], on_ramp['crypto_amount'])
+        return build_crypto_path(amount, send_currency, receive_currency, on_ramp, dex_swaps,
+                                 market['timed_out_chains'], market['fetch_time_ms'])
+
+    def stats(self) -> Dict[str, int]:
+        return {'inflight': len(self._inflight), 'leaders': self.leaders, 'joined': self.joined}
+
+
+quote_coalescer = QuoteCoalescer()
+
+async def build_quote(send_currency: str, receive_currency: str, send_amount: float, fx_data: Dict,
+                crypto_path_data: Dict, started: float,
+                stage_timings: Optional[Dict[str, float]] = None) -> QuoteResponse:
+    """Turn market data into a priced quote and cache it under a fresh quote_id
+
+    started is the time.monotonic() at which the request began.
+    """
     mid_market_rate = fx_data['rate']
     mid_market_amount = send_amount * mid_market_rate
     
-    # Step 2: Execute find_best_crypto_path logic
-    print("🪙 Finding best crypto path...")
-    crypto_path_data = await find_best_crypto_path(send_amount, send_currency, receive_currency)
-    
     route_options = None
     on_ramp_details = None
     if crypto_path_data['success']:
         best_path = crypto_path_data['path']
         crypto_final_amount = best_path['final_amount']
         base_effective_rate = (crypto_final_amount / send_amount) if send_amount else 0
-        our_rate = model_batching_savings(base_effective_rate, send_amount)
+        our_rate = model_batching_savings(base_effective_rate, send_amount, send_currency, receive_currency)
         our_amount = send_amount * our_rate
         route_options = crypto_path_data.get('routes', [])
         on_ramp_details = crypto_path_data.get('on_ramp')
@@ -453,20 +2087,26 @@ async def calculate_best_quote(send_currency: str, receive_currency: str, send_a
             'best_path': best_path,
             'routes': route_options,
             'on_ramp': on_ramp_details,
+            'timed_out_chains': crypto_path_data['timed_out_chains'],
             'processing_time_ms': crypto_path_data['processing_time_ms']
         }
+        if 'snapshot_age_ms' in crypto_path_data:
+            crypto_path['snapshot_age_ms'] = crypto_path_data['snapshot_age_ms']
     else:
         # Fallback to mid-market rate if crypto path fails
         our_rate = mid_market_rate
         our_amount = mid_market_amount
-        crypto_path = {'error': 'Crypto path unavailable'}
+        crypto_path = {
+            'error': 'Crypto path unavailable',
+            'timed_out_chains': crypto_path_data['timed_out_chains']
+        }
     
-    processing_time = (datetime.now() - start_time).total_seconds() * 1000
+    processing_time = (time.monotonic() - started) * 1000
     
     quote_id = str(uuid.uuid4())
     
     # Cache the quote
-    quote_cache[quote_id] = {
+    await store_call(quote_store.put, quote_id, {
         'send_currency': send_currency,
         'receive_currency': receive_currency,
         'send_amount': send_amount,
@@ -478,7 +2118,7 @@ async def calculate_best_quote(send_currency: str, receive_currency: str, send_a
         'route_options': route_options,
         'on_ramp_details': on_ramp_details,
         'timestamp': datetime.now().isoformat()
-    }
+    })
     
     return QuoteResponse(
         quote_id=quote_id,
@@ -493,9 +2133,261 @@ async def calculate_best_quote(send_currency: str, receive_currency: str, send_a
         timestamp=datetime.now().isoformat(),
         processing_time_ms=int(processing_time),
         route_options=route_options,
-        on_ramp_details=on_ramp_details
+        on_ramp_details=on_ramp_details,
+        stage_timings_ms=stage_timings
     )
 
+async def calculate_best_quote(send_currency: str, receive_currency: str, send_amount: float) -> QuoteResponse:
+    """Calculate the best quote using all available routes"""
+    timer = StageTimer()
+    
+    # Hot corridors are priced from the background snapshot without touching upstreams
+    snapshot = corridor_prewarmer.snapshot_for(send_currency, receive_currency)
+    if snapshot:
+        print(f"🔥 Serving {send_amount} {send_currency} → {receive_currency} from warm snapshot")
+        with timer.stage('warm_snapshot'):
+            crypto_path_data = corridor_prewarmer.price(snapshot, send_amount, send_currency, receive_currency)
+        return await finish_quote(send_currency, receive_currency, send_amount, snapshot['fx'], crypto_path_data, timer)
+    
+    print(f"🚀 Starting quote calculation: {send_amount} {send_currency} → {receive_currency}")
+    
+    # Identical concurrent requests share one fetch of the market data
+    market = await quote_coalescer.market_data(send_currency, receive_currency, send_amount, timer)
+    crypto_path_data = quote_coalescer.price(market, send_amount, send_currency, receive_currency)
+    
+    return await finish_quote(send_currency, receive_currency, send_amount, market['fx'], crypto_path_data, timer)
+
+async def finish_quote(send_currency: str, receive_currency: str, send_amount: float, fx_data: Dict,
+                 crypto_path_data: Dict, timer: StageTimer) -> QuoteResponse:
+    """build_quote with its own stage recorded and the full timing breakdown attached"""
+    with timer.stage('build_quote'):
+        quote = await build_quote(send_currency, receive_currency, send_amount, fx_data, crypto_path_data, timer.started)
+    timer.record('total', timer.started)
+    quote.stage_timings_ms = timer.stages
+    return quote
+
+# Best-path fields repeated from the winning route; compact responses point at the route instead
+BEST_PATH_ROUTE_FIELDS = ('chain', 'on_ramp', 'final_amount', 'path', 'effective_rate',
+                          'projected_batched_rate', 'projected_batched_amount')
+# Per-route copies of the shared on-ramp quote
+ROUTE_ON_RAMP_FIELDS = ('on_ramp_source', 'on_ramp_rate', 'on_ramp_crypto_amount')
+
+def compact_quote(quote: Dict[str, Any]) -> Dict[str, Any]:
+    """Reshape a quote so each route and the on-ramp quote appear once
+
+    routes and on_ramp move to the top level; crypto_path keeps best_route_index (into routes)
+    plus the fields that only exist on the best path.
+    """
+    crypto_path = quote.get('crypto_path') or {}
+    compact = {
+        key: value for key, value in quote.items()
+        if key not in ('crypto_path', 'route_options', 'on_ramp_details')
+    }
+    routes = [
+        {key: value for key, value in route.items() if key not in ROUTE_ON_RAMP_FIELDS}
+        for route in crypto_path.get('routes') or quote.get('route_options') or []
+    ]
+    compact['routes'] = routes
+    compact['on_ramp'] = crypto_path.get('on_ramp') or quote.get('on_ramp_details')
+    compact['crypto_path'] = {
+        key: value for key, value in crypto_path.items()
+        if key not in BEST_PATH_ROUTE_FIELDS and key not in ('best_path', 'routes')
+    }
+    if 'chain' in crypto_path:
+        compact['crypto_path']['best_route_index'] = next(
+            (i for i, route in enumerate(routes) if route['chain'] == crypto_path['chain']), None
+        )
+    return compact
+
+def format_sse(event: str, payload: Any) -> str:
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+async def stream_best_quote(send_currency: str, receive_currency: str, send_amount: float) -> AsyncIterator[str]:
+    """Streaming variant of calculate_best_quote that yields SSE messages as each stage resolves
+
+    Emits mid_market, on_ramp, one route per chain in the order chains answer, then
+    best_route with the cached quote (or error).
+    """
+    started = time.monotonic()
+    fanout = None
+    
+    try:
+        print(f"🚀 Starting streamed quote: {send_amount} {send_currency} → {receive_currency}")
+        fx_data = await call_fx_api(send_currency, receive_currency)
+        yield format_sse('mid_market', {
+            'mid_market_rate': fx_data['rate'],
+            'mid_market_amount': send_amount * fx_data['rate'],
+            'source': fx_data['source']
+        })
+        
+        on_ramp = await call_coinbase_api(send_amount, send_currency, "USDC")
+        yield format_sse('on_ramp', on_ramp)
+        
+        # Chain results are pushed onto the queue as they land; None marks the end of the fan-out
+        resolved: asyncio.Queue = asyncio.Queue()
+        fanout = asyncio.create_task(quote_chains(
+            on_ramp['crypto_amount'], receive_currency, started,
+            on_swap=lambda chain, dex_swap: resolved.put_nowait((chain, dex_swap))
+        ))
+        fanout.add_done_callback(lambda _: resolved.put_nowait(None))
+        while (resolved_chain := await resolved.get()) is not None:
+            chain, dex_swap = resolved_chain
+            yield format_sse('route', build_route(send_amount, send_currency, receive_currency,
+                                                  on_ramp, chain, dex_swap))
+        
+        dex_swaps, timed_out_chains = fanout.result()
+        processing_time = (time.monotonic() - started) * 1000
+        crypto_path_data = build_crypto_path(send_amount, send_currency, receive_currency,
+                                             on_ramp, dex_swaps, timed_out_chains, processing_time)
+        quote = await build_quote(send_currency, receive_currency, send_amount, fx_data, crypto_path_data, started)
+        yield format_sse('best_route', quote.model_dump())
+    except Exception as e:
+        print(f"❌ Streamed quote error: {e}")
+        yield format_sse('error', {'detail': str(e)})
+    finally:
+        # Client went away mid-stream: stop the remaining chain lookups
+        if fanout and not fanout.done():
+            fanout.cancel()
+
+async def calculate_batch_quotes(quote_requests: List[QuoteRequest]) -> BatchQuoteResponse:
+    """Price many quotes from one shared snapshot of FX, on-ramp and per-chain swap rates"""
+    started = time.monotonic()
+    
+    print(f"📦 Batch quote calculation for {len(quote_requests)} requests")
+    
+    # Step 1: Collect the distinct upstream lookups the batch needs
+    corridors = {(r.send_currency, r.receive_currency) for r in quote_requests}
+    on_ramp_amounts: Dict[str, float] = {}
+    for r in quote_requests:
+        on_ramp_amounts[r.send_currency] = max(on_ramp_amounts.get(r.send_currency, 0), r.send_amount)
+    receive_currencies = {r.receive_currency for r in quote_requests}
+    
+    # Step 2: Fetch each of them once, concurrently (on-ramp and swap pricing scale linearly)
+    async def fetch_on_ramp(currency: str) -> Tuple[str, Dict]:
+        return currency, await call_coinbase_api(on_ramp_amounts[currency] or 1.0, currency, "USDC")
+    
+    async def fetch_swaps(currency: str) -> Tuple[str, Tuple[Dict[str, Dict], List[str]]]:
+        return currency, await quote_chains(1.0, currency, started)
+    
+    async def fetch_fx(corridor: Tuple[str, str]) -> Tuple[Tuple[str, str], Dict]:
+        return corridor, await call_fx_api(*corridor)
+    
+    fx_results, on_ramp_results, swap_results = await asyncio.gather(
+        asyncio.gather(*(fetch_fx(corridor) for corridor in corridors)),
+        asyncio.gather(*(fetch_on_ramp(currency) for currency in on_ramp_amounts)),
+        asyncio.gather(*(fetch_swaps(currency) for currency in receive_currencies))
+    )
+    fx_rates = dict(fx_results)
+    on_ramps = dict(on_ramp_results)
+    swaps = dict(swap_results)
+    
+    # Step 3: Price every request from the snapshot
+    items: List[BatchQuoteItem] = []
+    for index, r in enumerate(quote_requests):
+        try:
+            if r.send_amount <= 0:
+                raise ValueError("send_amount must be greater than zero")
+            on_ramp = scale_on_ramp(on_ramps[r.send_currency], on_ramp_amounts[r.send_currency] or 1.0, r.send_amount)
+            unit_swaps, timed_out_chains = swaps[r.receive_currency]
+            dex_swaps = scale_dex_swaps(unit_swaps, 1.0, on_ramp['crypto_amount'])
+            processing_time = (time.monotonic() - started) * 1000
+            crypto_path_data = build_crypto_path(r.send_amount, r.send_currency, r.receive_currency,
+                                                 on_ramp, dex_swaps, timed_out_chains, processing_time)
+            quote = await build_quote(r.send_currency, r.receive_currency, r.send_amount,
+                                      fx_rates[(r.send_currency, r.receive_currency)], crypto_path_data, started)
+            items.append(BatchQuoteItem(index=index, quote=quote))
+        except Exception as e:
+            print(f"❌ Batch item {index} error: {e}")
+            items.append(BatchQuoteItem(index=index, error=str(e)))
+    
+    processing_time = (time.monotonic() - started) * 1000
+    
+    return BatchQuoteResponse(
+        quotes=items,
+        processing_time_ms=int(processing_time),
+        upstream_lookups={
+            'fx': len(corridors),
+            'on_ramp': len(on_ramp_amounts),
+            'chain_fanouts': len(receive_currencies)
+        }
+    )
+
+class CorridorPrewarmer:
+    """Keeps FX, on-ramp and per-chain swap snapshots fresh for the busiest corridors"""
+
+    def __init__(self, corridors: List[Tuple[str, str]], interval_seconds: float = WARM_REFRESH_INTERVAL_SECONDS,
+                 max_age_seconds: float = WARM_SNAPSHOT_MAX_AGE_SECONDS,
+                 reference_amount: float = WARM_REFERENCE_AMOUNT):
+        self.corridors = corridors
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.reference_amount = reference_amount
+        self.snapshots: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    async def refresh_corridor(self, send_currency: str, receive_currency: str):
+        """Re-price one corridor at the reference amount"""
+        started = time.monotonic()
+        fx_data, on_ramp = await asyncio.gather(
+            call_fx_api(send_currency, receive_currency),
+            call_coinbase_api(self.reference_amount, send_currency, "USDC")
+        )
+        dex_swaps, timed_out_chains = await quote_chains(on_ramp['crypto_amount'], receive_currency, started)
+        if not dex_swaps:
+            # Keep the previous snapshot until it ages out rather than serving an empty one
+            print(f"⚠️ Pre-warm for {send_currency} → {receive_currency} found no routes")
+            return
+        self.snapshots[(send_currency, receive_currency)] = {
+            'fx': fx_data,
+            'on_ramp': on_ramp,
+            'dex_swaps': dex_swaps,
+            'timed_out_chains': timed_out_chains,
+            'refreshed_at': time.monotonic(),
+            'refresh_time_ms': (time.monotonic() - started) * 1000
+        }
+
+    async def run(self):
+        """Refresh every corridor on a fixed schedule"""
+        print(f"🔥 Pre-warming corridors: {', '.join(f'{s}→{r}' for s, r in self.corridors)}")
+        while True:
+            results = await asyncio.gather(
+                *(self.refresh_corridor(send, receive) for send, receive in self.corridors),
+                return_exceptions=True
+            )
+            for (send, receive), result in zip(self.corridors, results):
+                if isinstance(result, Exception):
+                    print(f"⚠️ Pre-warm for {send} → {receive} failed: {result}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def snapshot_for(self, send_currency: str, receive_currency: str) -> Optional[Dict[str, Any]]:
+        """Return the corridor's snapshot if it is fresh enough to serve"""
+        snapshot = self.snapshots.get((send_currency.upper(), receive_currency.upper()))
+        if snapshot and time.monotonic() - snapshot['refreshed_at'] <= self.max_age_seconds:
+            return snapshot
+        return None
+
+    def price(self, snapshot: Dict[str, Any], amount: float, send_currency: str, receive_currency: str) -> Dict:
+        """Scale a snapshot taken at the reference amount to the requested amount"""
+        on_ramp = scale_on_ramp(snapshot['on_ramp'], self.reference_amount, amount)
+        dex_swaps = scale_dex_swaps(snapshot['dex_swaps'], snapshot['on_ramp']['crypto_amount'], on_ramp['crypto_amount'])
+        crypto_path_data = build_crypto_path(amount, send_currency, receive_currency, on_ramp, dex_swaps,
+                                             snapshot['timed_out_chains'], snapshot['refresh_time_ms'])
+        crypto_path_data['snapshot_age_ms'] = (time.monotonic() - snapshot['refreshed_at']) * 1000
+        return crypto_path_data
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            f"{send}:{receive}": (
+                round(now - self.snapshots[(send, receive)]['refreshed_at'], 1)
+                if (send, receive) in self.snapshots else None
+            )
+            for send, receive in self.corridors
+        }
+
+
+corridor_prewarmer = CorridorPrewarmer(WARM_CORRIDORS)
+
 # API Endpoints
 @app.get("/")
 async def root():
@@ -507,7 +2399,12 @@ async def root():
     }
 
 @app.post("/quote", response_model=QuoteResponse)
-async def get_quote(request: QuoteRequest):
+async def get_quote(
+    request: QuoteRequest,
+    include_timings: bool = Query(False, description="Return the per-stage latency breakdown"),
+    response_format: Optional[str] = Query(None, alias="format", description="'compact' returns each route once"),
+    x_response_format: Optional[str] = Header(None)
+):
     """Get a quote for cross-currency transaction"""
     try:
         print(f"📊 Quote request: {request.send_amount} {request.send_currency} → {request.receive_currency}")
@@ -519,15 +2416,447 @@ async def get_quote(request: QuoteRequest):
         )
         
         print(f"✅ Quote generated: {quote.our_amount:.2f} {request.receive_currency}")
+        if not include_timings:
+            quote.stage_timings_ms = None
+        if (response_format or x_response_format or '').lower() == 'compact':
+            return ORJSONResponse(compact_quote(quote.model_dump()))
         return quote
         
     except Exception as e:
         print(f"❌ Quote error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/quote/stream")
+async def stream_quote(send_currency: str, receive_currency: str, send_amount: float):
+    """Stream a quote as Server-Sent Events, route by route"""
+    print(f"📊 Streamed quote request: {send_amount} {send_currency} → {receive_currency}")
+    return StreamingResponse(
+        stream_best_quote(send_currency, receive_currency, send_amount),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/quotes/batch", response_model=BatchQuoteResponse)
+async def get_batch_quotes(request: BatchQuoteRequest):
+    """Get quotes for many corridors and amounts in one call"""
+    if not request.quotes:
+        raise HTTPException(status_code=400, detail="At least one quote request is required")
+    if len(request.quotes) > BATCH_QUOTE_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_QUOTE_MAX_ITEMS} quote requests")
+    try:
+        batch = await calculate_batch_quotes(request.quotes)
+        print(f"✅ Batch quotes generated: {sum(1 for item in batch.quotes if item.quote)}/{len(batch.quotes)}")
+        return batch
+    except Exception as e:
+        print(f"❌ Batch quote error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def claim_idempotency_key(entry_key: str, marker: Dict[str, Any]) -> Optional[TransferExecuteResponse]:
+    """Mark a transfer in flight under its Idempotency-Key
+
+    `marker` is the in-flight entry, carrying the request fingerprint and a per-request owner
+    token. Returns None when this request now owns the key, or the stored response when the
+    same request already completed. Raises 409 while the original is still running and 422
+    if the key was used for a different request.
+    """
+    if await store_call(idempotency_store.put_if_absent, entry_key, marker, IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS):
+        return None
+    
+    entry = await store_call(idempotency_store.get, entry_key)
+    if entry is None or entry['status'] == 'in_flight':
+        raise HTTPException(status_code=409, detail="A transfer with this Idempotency-Key is already in progress")
+    if entry['request'] != marker['request']:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different transfer")
+    print(f"♻️ Replaying transfer {entry['response']['transaction_id']} for repeated Idempotency-Key")
+    return TransferExecuteResponse(**entry['response'])
+
+async def refresh_idempotency_key(entry_key: str, marker: Dict[str, Any]):
+    """Keep an owned in-flight marker alive while its transfer settles; cancel when done"""
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS / 3)
+        if not await store_call(idempotency_store.replace_if, entry_key, marker, marker,
+                                IDEMPOTENCY_IN_FLIGHT_TTL_SECONDS):
+            print(f"⚠️ Lost in-flight marker for Idempotency-Key {entry_key}")
+            return
+
+def uncompacted_ledger_query(user_id: str):
+    """A user's ledger entries not yet folded into their balance snapshot"""
+    return (
+        db.collection('ledger_entries')
+        .where('user_id', '==', user_id)
+        .where('compacted', '==', False)
+    )
+
+def apply_ledger_entries(balances: Dict[str, float], entries: List[Any]) -> Dict[str, float]:
+    """Snapshot balances plus the signed amounts of the given ledger entry snapshots"""
+    balances = dict(balances)
+    for entry in entries:
+        entry_data = entry.to_dict()
+        balances[entry_data['currency']] = balances.get(entry_data['currency'], 0) + entry_data['amount']
+    return balances
+
+def ledger_entry(user_id: str, transaction_id: str, currency: str, amount: float) -> Dict[str, Any]:
+    return {
+        'user_id': user_id,
+        'transaction_id': transaction_id,
+        'currency': currency,
+        'amount': amount,
+        'compacted': False,
+        'createdAt': firestore.SERVER_TIMESTAMP
+    }
+
+def read_user_with_balances(user_id: str) -> Optional[Dict[str, Any]]:
+    """A user document with live balances, or None if it doesn't exist (blocking Firestore I/O)
+
+    The snapshot and the pending entries are read in one read-only transaction, so a
+    compaction committing between the two reads can't drop entries from the sum.
+    """
+    @firestore.transactional
+    def read_balances(transaction) -> Optional[Dict[str, Any]]:
+        user_doc = transaction.get(db.collection('users').document(user_id))
+        if isinstance(user_doc, Generator):
+            user_doc = next(user_doc, None)
+        if not user_doc or not getattr(user_doc, 'exists', False):
+            return None
+        user_data = user_doc.to_dict()
+        entries = list(transaction.get(uncompacted_ledger_query(user_id)))
+        user_data['balances'] = apply_ledger_entries(user_data.get('balances', {}), entries)
+        return user_data
+
+    return read_balances(db.transaction(read_only=True))
+
+def compact_user_ledger(user_id: str) -> int:
+    """Fold a user's uncompacted ledger entries into their balance snapshot (blocking Firestore I/O)"""
+    @firestore.transactional
+    def fold_entries(transaction) -> int:
+        user_ref = db.collection('users').document(user_id)
+        user_doc = transaction.get(user_ref)
+        if isinstance(user_doc, Generator):
+            user_doc = next(user_doc, None)
+        if not user_doc or not getattr(user_doc, 'exists', False):
+            return 0
+        entries = list(transaction.get(uncompacted_ledger_query(user_id).limit(LEDGER_COMPACTION_BATCH)))
+        if not entries:
+            return 0
+        balances = apply_ledger_entries(user_doc.to_dict().get('balances', {}), entries)
+        transaction.update(user_ref, {'balances': balances})
+        # Entries are kept as history; the flag takes them out of the live balance sum
+        for entry in entries:
+            transaction.update(entry.reference, {'compacted': True})
+        return len(entries)
+
+    folded = fold_entries(db.transaction())
+    if folded:
+        print(f"🗜️ Compacted {folded} ledger entries for {user_id}")
+    return folded
+
+# Compactions started after a transfer, kept referenced until they finish
+pending_compactions: set = set()
+
+def request_ledger_compaction(user_id: str):
+    task = asyncio.ensure_future(blocking_io.run(compact_user_ledger, user_id))
+    pending_compactions.add(task)
+    task.add_done_callback(pending_compactions.discard)
+
+def pending_ledger_users(after_user_id: Optional[str]) -> List[str]:
+    """Next page of user ids with uncompacted entries, in id order (blocking Firestore I/O)
+
+    Requires a composite index on ledger_entries (compacted ASC, user_id ASC).
+    """
+    query = (
+        db.collection('ledger_entries')
+        .where('compacted', '==', False)
+        .order_by('user_id')
+        .select(['user_id'])
+    )
+    if after_user_id is not None:
+        query = query.start_after({'user_id': after_user_id})
+    entries = query.limit(LEDGER_COMPACTION_BATCH).stream()
+    return sorted({entry.to_dict()['user_id'] for entry in entries})
+
+async def compact_all_ledgers() -> int:
+    """Fold every user's pending entries, paging through users so none is skipped"""
+    folded = 0
+    last_user_id = None
+    while True:
+        user_ids = await blocking_io.run(pending_ledger_users, last_user_id)
+        if not user_ids:
+            return folded
+        for user_id in user_ids:
+            try:
+                # Each pass folds at most LEDGER_COMPACTION_BATCH entries
+                while True:
+                    count = await blocking_io.run(compact_user_ledger, user_id)
+                    folded += count
+                    if count < LEDGER_COMPACTION_BATCH:
+                        break
+            except Exception as e:
+                print(f"⚠️ Ledger compaction failed for {user_id}: {e}")
+        last_user_id = user_ids[-1]
+
+async def compact_ledgers():
+    """Periodically fold every user's pending ledger entries into their snapshot"""
+    while True:
+        await asyncio.sleep(LEDGER_COMPACTION_INTERVAL_SECONDS)
+        try:
+            await compact_all_ledgers()
+        except Exception as e:
+            print(f"⚠️ Ledger compaction failed: {e}")
+
+async def settle_transfer(user_id: str, transaction_id: str, quote_id: str, quote_data: Dict[str, Any],
+                          receiver_email: str) -> TransferExecuteResponse:
+    """Move the funds for an accepted quote: receiver lookup, optional Stripe deposit, Firestore transaction
+
+    Safe to repeat for the same transaction_id: the Stripe deposit is keyed on it and an
+    already-recorded transaction is not applied twice. A repeat returns the stored result
+    without publishing, invalidating or batching anything again.
+    """
+    # Find receiver document ID first (outside transaction)
+    print(f"🔍 Looking for receiver with email: {receiver_email}")
+    receiver_doc_id = await blocking_io.run(resolve_user_id_by_email, receiver_email)
+    
+    if not receiver_doc_id:
+        print(f"❌ No receiver found with email: {receiver_email}")
+        raise HTTPException(status_code=404, detail="Receiver not found")
+    
+    print(f"✅ Receiver document ID: {receiver_doc_id}")
+
+    stripe_payment = None
+    requires_stripe_deposit = (
+        receiver_email.lower() == "noahphilip@utexas.edu"
+        and quote_data['receive_currency'].lower() == 'usd'
+    )
+
+    if requires_stripe_deposit:
+        try:
+            stripe_payment = await blocking_io.run(
+                process_stripe_deposit,
+                quote_data['our_amount'],
+                receiver_email,
+                quote_id,
+                f"deposit-{transaction_id}"
+            )
+        except Exception as stripe_error:
+            error_message = str(stripe_error)
+            raise HTTPException(status_code=502, detail=f"Stripe deposit failed: {error_message}")
+    
+    # Execute Firestore transaction. Returns (stored record if this transaction was already
+    # recorded, sender's pending ledger entries after this one)
+    @firestore.transactional
+    def run_transfer_transaction(transaction) -> Tuple[Optional[Dict[str, Any]], int]:
+        print(f"🔄 Starting transaction for user_id: {user_id}, receiver_id: {receiver_doc_id}")
+
+        # A queued transfer can be re-run after a worker crash; never apply it twice
+        transaction_ref = db.collection('transactions').document(transaction_id)
+        existing_doc = transaction.get(transaction_ref)
+        if isinstance(existing_doc, Generator):
+            existing_doc = next(existing_doc, None)
+        if existing_doc and getattr(existing_doc, 'exists', False):
+            print(f"⏭️ Transaction {transaction_id} already recorded")
+            return existing_doc.to_dict(), 0
+
+        # Read sender's balance snapshot and the ledger entries not yet folded into it
+        sender_ref = db.collection('users').document(user_id)
+        print(f"📤 Getting sender document: {user_id}")
+        sender_doc = transaction.get(sender_ref)
+        if isinstance(sender_doc, Generator):
+            sender_doc = next(sender_doc, None)
+        print(f"📤 Sender document type: {type(sender_doc)}")
+        print(f"📤 Sender document exists: {getattr(sender_doc, 'exists', None)}")
+
+        # Check if sender document exists
+        if not sender_doc or not getattr(sender_doc, 'exists', False):
+            raise Exception("Sender user not found")
+
+        sender_entries = list(transaction.get(uncompacted_ledger_query(user_id)))
+        sender_balances = apply_ledger_entries(sender_doc.to_dict().get('balances', {}), sender_entries)
+
+        # Check if sender has sufficient balance
+        sent_currency = quote_data['send_currency'].lower()
+        sent_amount = quote_data['send_amount']
+
+        if sender_balances.get(sent_currency, 0) < sent_amount:
+            raise Exception("Insufficient balance")
+
+        # Read receiver's user document using the found ID
+        receiver_ref = db.collection('users').document(receiver_doc_id)
+        receiver_doc = transaction.get(receiver_ref)
+        if isinstance(receiver_doc, Generator):
+            receiver_doc = next(receiver_doc, None)
+        print(f"📥 Receiver document type: {type(receiver_doc)}")
+        print(f"📥 Receiver document exists: {getattr(receiver_doc, 'exists', None)}")
+
+        if not receiver_doc or not getattr(receiver_doc, 'exists', False):
+            raise Exception("Receiver document not found")
+
+        received_currency = quote_data['receive_currency'].lower()
+        received_amount = quote_data['our_amount']
+
+        print(f"💰 Ledger - Sender {sent_currency}: -{sent_amount}, Receiver {received_currency}: +{received_amount}")
+
+        # Append debit and credit entries instead of rewriting either user document, so
+        # transfers touching the same user only meet on the ledger rows they read
+        ledger = db.collection('ledger_entries')
+        transaction.set(ledger.document(f"{transaction_id}-debit"),
+                        ledger_entry(user_id, transaction_id, sent_currency, -sent_amount))
+        transaction.set(ledger.document(f"{transaction_id}-credit"),
+                        ledger_entry(receiver_doc_id, transaction_id, received_currency, received_amount))
+
+        # Create transaction record
+        transaction.set(transaction_ref, {
+            'sender_id': user_id,
+            'receiver_id': receiver_doc_id,
+            'receiver_email': receiver_email,
+            'sent_amount': sent_amount,
+            'sent_currency': quote_data['send_currency'],
+            'received_amount': received_amount,
+            'received_currency': quote_data['receive_currency'],
+            'rate': quote_data['our_rate'],
+            'timestamp': firestore.SERVER_TIMESTAMP,
+                'crypto_path': quote_data['crypto_path'],
+                'route_options': quote_data.get('route_options'),
+                'on_ramp_details': quote_data.get('on_ramp_details'),
+                'stripe_payment_id': stripe_payment.get('id') if stripe_payment else None,
+                'stripe_payment_status': stripe_payment.get('status') if stripe_payment else None,
+                'stripe_payment_client_secret': stripe_payment.get('client_secret') if stripe_payment else None
+        })
+
+        print(f"✅ Transaction {transaction_id} recorded")
+        return None, len(sender_entries) + 1
+
+    try:
+        existing_record, sender_pending_entries = await blocking_io.run(
+            lambda: run_transfer_transaction(db.transaction())
+        )
+    except Exception as e:
+        print(f"❌ Transaction failed, rolling back: {e}")
+        if stripe_payment and stripe_payment.get('id'):
+            try:
+                await blocking_io.run(stripe.Refund.create, payment_intent=stripe_payment['id'])
+                print(f"♻️ Stripe payment {stripe_payment['id']} refunded due to transfer failure")
+            except Exception as refund_error:
+                print(f"⚠️ Failed to refund Stripe payment {stripe_payment['id']}: {refund_error}")
+        raise e
+    
+    if existing_record is not None:
+        # Already applied by an earlier attempt, which did the follow-up work below
+        recorded_at = existing_record.get('timestamp')
+        return TransferExecuteResponse(
+            transaction_id=transaction_id,
+            status="COMPLETED",
+            message="Transfer executed successfully",
+            timestamp=recorded_at.isoformat() if isinstance(recorded_at, datetime) else datetime.now().isoformat(),
+            stripe_payment_id=existing_record.get('stripe_payment_id'),
+            stripe_payment_status=existing_record.get('stripe_payment_status'),
+            stripe_payment_client_secret=existing_record.get('stripe_payment_client_secret')
+        )
+    
+    # Both parties' balances changed
+    profile_cache.delete(user_id)
+    profile_cache.delete(receiver_doc_id)
+    update_hub.publish(user_id, {
+        'type': 'balance', 'transaction_id': transaction_id,
+        'currency': quote_data['send_currency'].lower(), 'delta': -quote_data['send_amount']
+    })
+    update_hub.publish(receiver_doc_id, {
+        'type': 'balance', 'transaction_id': transaction_id,
+        'currency': quote_data['receive_currency'].lower(), 'delta': quote_data['our_amount']
+    })
+    publish_transfer_status(user_id, transaction_id, 'COMPLETED')
+    
+    # Keep busy senders' balance reads short
+    if sender_pending_entries >= LEDGER_COMPACTION_THRESHOLD:
+        request_ledger_compaction(user_id)
+    
+    # Queue the executed transfer for netting against opposite-direction flows
+    transfer_batching.submit(
+        quote_data['send_currency'], quote_data['receive_currency'],
+        quote_data['send_amount'], quote_data['our_amount'], transaction_id
+    )
+    
+    return TransferExecuteResponse(
+        transaction_id=transaction_id,
+        status="COMPLETED",
+        message="Transfer executed successfully",
+        timestamp=datetime.now().isoformat(),
+        stripe_payment_id=stripe_payment.get('id') if stripe_payment else None,
+        stripe_payment_status=stripe_payment.get('status') if stripe_payment else None,
+        stripe_payment_client_secret=stripe_payment.get('client_secret') if stripe_payment else None
+    )
+
+async def restore_quote(quote_id: str, quote_data: Dict[str, Any], expires_at: float):
+    """Put a quote taken by a transfer that failed back for the rest of its lifetime"""
+    remaining = expires_at - time.time()
+    if remaining > 0:
+        await store_call(quote_store.put, quote_id, quote_data, remaining)
+
+async def settle_queued_transfer(job: Dict[str, Any]):
+    """Settle one claimed transfer and record the outcome on its queue row
+
+    A failed transfer gets its quote back, as a failed synchronous transfer does.
+    """
+    transaction_id = job['transaction_id']
+    payload = job['payload']
+    print(f"🏗️ Settling queued transfer {transaction_id} (attempt {job['attempts']})")
+    publish_transfer_status(job['user_id'], transaction_id, 'PROCESSING')
+    try:
+        response = await settle_transfer(job['user_id'], transaction_id, payload['quote_id'],
+                                         payload['quote'], payload['receiver_email'])
+    except HTTPException as e:
+        error = str(e.detail)
+    except Exception as e:
+        print(f"❌ Queued transfer {transaction_id} failed: {e}")
+        error = str(e)
+    else:
+        await blocking_io.run(transfer_queue.complete, transaction_id, response.model_dump())
+        return
+    # Marked FAILED first so a re-claim can't settle the quote while it is back in the cache
+    await blocking_io.run(transfer_queue.fail, transaction_id, error)
+    if payload.get('quote_expires_at'):
+        await restore_quote(payload['quote_id'], payload['quote'], payload['quote_expires_at'])
+    publish_transfer_status(job['user_id'], transaction_id, 'FAILED', error)
+
+async def run_transfer_worker():
+    """Settle queued transfers one at a time; TRANSFER_WORKERS of these bound the concurrency"""
+    while True:
+        try:
+            # Cleared before claiming so an enqueue that lands in between still wakes us
+            transfer_queue.wakeup.clear()
+            job = await blocking_io.run(transfer_queue.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(transfer_queue.wakeup.wait(), timeout=TRANSFER_QUEUE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await settle_queued_transfer(job)
+        except Exception as e:
+            # Queue I/O failed (e.g. "database is locked" under contention); a row we had
+            # claimed goes back to the queue once its lease runs out
+            print(f"❌ Transfer worker error, retrying in {TRANSFER_QUEUE_POLL_SECONDS}s: {e}")
+            await asyncio.sleep(TRANSFER_QUEUE_POLL_SECONDS)
+
 @app.post("/transfer/execute", response_model=TransferExecuteResponse)
-async def execute_transfer(request: TransferExecuteRequest, user_token: dict = Depends(verify_firebase_token)):
-    """Execute a transfer with Firebase authentication"""
+async def execute_transfer(
+    request: TransferExecuteRequest,
+    response: Response,
+    user_token: dict = Depends(verify_firebase_token),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    mode: Optional[str] = Query(None, description="'async' queues the transfer and returns 202"),
+    prefer: Optional[str] = Header(None)
+):
+    """Execute a transfer with Firebase authentication
+
+    Retries that send the same Idempotency-Key get the original response back without
+    touching Stripe or Firestore again. With ?mode=async (or Prefer: respond-async) the
+    transfer is queued and 202 is returned at once; poll /transfer/status/{transaction_id}.
+    """
+    run_async = mode == 'async' or 'respond-async' in (prefer or '')
+    # Set once this request owns an Idempotency-Key, so failures can release it for retries.
+    # Only the entry still holding this request's marker is ever overwritten or released
+    claimed_key = None
+    claimed_marker = None
+    heartbeat = None
     try:
         if not db:
             raise HTTPException(status_code=500, detail="Database not available")
@@ -535,167 +2864,218 @@ async def execute_transfer(request: TransferExecuteRequest, user_token: dict = D
         user_id = user_token['uid']
         user_email = user_token.get('email', '')
         
-        # Get cached quote
-        if request.quote_id not in quote_cache:
-            raise HTTPException(status_code=404, detail="Quote not found or expired")
-        
-        quote_data = quote_cache[request.quote_id]
-        
-        # Find receiver document ID first (outside transaction)
-        print(f"🔍 Looking for receiver with email: {request.receiver_email}")
-        receiver_query = db.collection('users').where('email', '==', request.receiver_email).limit(1)
-        receiver_snapshot = receiver_query.get()  # Get QuerySnapshot
-        receiver_docs = list(receiver_snapshot)  # Convert to list of DocumentSnapshot
-        print(f"📋 Found {len(receiver_docs)} receiver documents")
-        
-        if not receiver_docs:
-            print(f"❌ No receiver found with email: {request.receiver_email}")
-            raise HTTPException(status_code=404, detail="Receiver not found")
+        if idempotency_key:
+            # Keys are scoped per user so one client can't replay another's transfer
+            entry_key = f"{user_id}:{idempotency_key}"
+            marker = {
+                'status': 'in_flight',
+                'request': {'quote_id': request.quote_id, 'receiver_email': request.receiver_email},
+                'owner': str(uuid.uuid4())
+            }
+            replay = await claim_idempotency_key(entry_key, marker)
+            if replay:
+                if replay.status == "QUEUED":
+                    response.status_code = 202
+                return replay
+            claimed_key, claimed_marker = entry_key, marker
+            heartbeat = asyncio.create_task(refresh_idempotency_key(entry_key, marker))
         
-        receiver_doc_snapshot = receiver_docs[0]
-        print(f"✅ Receiver document type: {type(receiver_doc_snapshot)}")
-        print(f"✅ Receiver document ID: {receiver_doc_snapshot.id}")
-        receiver_doc_id = receiver_doc_snapshot.id
-
-        stripe_payment = None
-        requires_stripe_deposit = (
-            request.receiver_email.lower() == "noahphilip@utexas.edu"
-            and quote_data['receive_currency'].lower() == 'usd'
-        )
-
-        if requires_stripe_deposit:
-            try:
-                stripe_payment = process_stripe_deposit(
-                    quote_data['our_amount'],
-                    request.receiver_email,
-                    request.quote_id
-                )
-            except Exception as stripe_error:
-                error_message = str(stripe_error)
-                raise HTTPException(status_code=502, detail=f"Stripe deposit failed: {error_message}")
+        # Take the quote out of the cache (expired quotes are rejected). Quotes are single-use:
+        # a concurrent request, or a retry whose in-flight marker has expired, finds it gone
+        taken = await store_call(quote_store.take, request.quote_id)
+        if taken is None:
+            raise HTTPException(status_code=404, detail="Quote not found or expired")
+        quote_data, quote_ttl = taken
+        quote_expires_at = time.time() + quote_ttl
         
-        # Execute Firestore transaction
         transaction_id = str(uuid.uuid4())
-        
-        @firestore.transactional
-        def run_transfer_transaction(transaction):
-            print(f"🔄 Starting transaction for user_id: {user_id}, receiver_id: {receiver_doc_id}")
-
-            # Read sender's user document
-            sender_ref = db.collection('users').document(user_id)
-            print(f"📤 Getting sender document: {user_id}")
-            sender_doc = transaction.get(sender_ref)
-            if isinstance(sender_doc, Generator):
-                sender_doc = next(sender_doc, None)
-            print(f"📤 Sender document type: {type(sender_doc)}")
-            print(f"📤 Sender document exists: {getattr(sender_doc, 'exists', None)}")
-
-            # Check if sender document exists
-            if not sender_doc or not getattr(sender_doc, 'exists', False):
-                raise Exception("Sender user not found")
-
-            sender_data = sender_doc.to_dict()
-            sender_balances = dict(sender_data.get('balances', {}))
-
-            # Check if sender has sufficient balance
-            sent_currency = quote_data['send_currency'].lower()
-            sent_amount = quote_data['send_amount']
-
-            if sender_balances.get(sent_currency, 0) < sent_amount:
-                raise Exception("Insufficient balance")
-
-            # Read receiver's user document using the found ID
-            receiver_ref = db.collection('users').document(receiver_doc_id)
-            receiver_doc = transaction.get(receiver_ref)
-            if isinstance(receiver_doc, Generator):
-                receiver_doc = next(receiver_doc, None)
-            print(f"📥 Receiver document type: {type(receiver_doc)}")
-            print(f"📥 Receiver document exists: {getattr(receiver_doc, 'exists', None)}")
-
-            if not receiver_doc or not getattr(receiver_doc, 'exists', False):
-                raise Exception("Receiver document not found")
-
-            receiver_data = receiver_doc.to_dict()
-            receiver_balances = dict(receiver_data.get('balances', {}))
-
-            same_user = (user_id == receiver_doc_id)
-
-            print(f"💰 Updating balances - Sender {sent_currency}: {sender_balances.get(sent_currency, 0)} -> {sender_balances.get(sent_currency, 0) - sent_amount}")
-            print(f"💰 Updating balances - Receiver {quote_data['receive_currency'].lower()}: {receiver_balances.get(quote_data['receive_currency'].lower(), 0)} -> {receiver_balances.get(quote_data['receive_currency'].lower(), 0) + quote_data['our_amount']}")
-
-            # Update sender's balance
-            received_currency = quote_data['receive_currency'].lower()
-            received_amount = quote_data['our_amount']
-
-            if same_user:
-                sender_balances[sent_currency] -= sent_amount
-                sender_balances[received_currency] = sender_balances.get(received_currency, 0) + received_amount
-                transaction.update(sender_ref, {'balances': sender_balances})
-            else:
-                sender_balances[sent_currency] -= sent_amount
-                transaction.update(sender_ref, {'balances': sender_balances})
-
-                receiver_balances[received_currency] = receiver_balances.get(received_currency, 0) + received_amount
-                transaction.update(receiver_ref, {'balances': receiver_balances})
-
-            # Create transaction record
-            transaction_ref = db.collection('transactions').document(transaction_id)
-            transaction.set(transaction_ref, {
-                'sender_id': user_id,
-                'receiver_email': request.receiver_email,
-                'sent_amount': sent_amount,
-                'sent_currency': quote_data['send_currency'],
-                'received_amount': received_amount,
-                'received_currency': quote_data['receive_currency'],
-                'rate': quote_data['our_rate'],
-                'timestamp': firestore.SERVER_TIMESTAMP,
-                    'crypto_path': quote_data['crypto_path'],
-                    'route_options': quote_data.get('route_options'),
-                    'on_ramp_details': quote_data.get('on_ramp_details'),
-                    'stripe_payment_id': stripe_payment.get('id') if stripe_payment else None,
-                    'stripe_payment_status': stripe_payment.get('status') if stripe_payment else None,
-                    'stripe_payment_client_secret': stripe_payment.get('client_secret') if stripe_payment else None
-            })
-
-            print(f"✅ Transaction {transaction_id} recorded")
-
         try:
-            transaction = db.transaction()
-            run_transfer_transaction(transaction)
-        except Exception as e:
-            print(f"❌ Transaction failed, rolling back: {e}")
-            if stripe_payment and stripe_payment.get('id'):
-                try:
-                    stripe.Refund.create(payment_intent=stripe_payment['id'])
-                    print(f"♻️ Stripe payment {stripe_payment['id']} refunded due to transfer failure")
-                except Exception as refund_error:
-                    print(f"⚠️ Failed to refund Stripe payment {stripe_payment['id']}: {refund_error}")
-            raise e
+            if run_async:
+                # The queued payload carries its own copy of the quote, and its expiry so a
+                # failed settlement can return it to the cache
+                await blocking_io.run(transfer_queue.enqueue, transaction_id, user_id, {
+                    'quote_id': request.quote_id,
+                    'receiver_email': request.receiver_email,
+                    'quote': quote_data,
+                    'quote_expires_at': quote_expires_at
+                })
+            else:
+                result = await settle_transfer(user_id, transaction_id, request.quote_id, quote_data,
+                                               request.receiver_email)
+        except Exception:
+            # Nothing was settled; give the quote back for the rest of its lifetime
+            await restore_quote(request.quote_id, quote_data, quote_expires_at)
+            raise
         
-        # Remove quote from cache
-        del quote_cache[request.quote_id]
+        if run_async:
+            if transfer_queue.wakeup:
+                transfer_queue.wakeup.set()
+            print(f"📥 Transfer {transaction_id} queued for settlement")
+            publish_transfer_status(user_id, transaction_id, 'QUEUED')
+            result = TransferExecuteResponse(
+                transaction_id=transaction_id,
+                status="QUEUED",
+                message=f"Transfer accepted; poll /transfer/status/{transaction_id} for progress",
+                timestamp=datetime.now().isoformat()
+            )
+            response.status_code = 202
         
-        return TransferExecuteResponse(
-            transaction_id=transaction_id,
-            status="COMPLETED",
-            message="Transfer executed successfully",
-            timestamp=datetime.now().isoformat(),
-            stripe_payment_id=stripe_payment.get('id') if stripe_payment else None,
-            stripe_payment_status=stripe_payment.get('status') if stripe_payment else None,
-            stripe_payment_client_secret=stripe_payment.get('client_secret') if stripe_payment else None
-        )
+        if claimed_key:
+            if not await store_call(idempotency_store.replace_if, claimed_key, claimed_marker, {
+                'status': 'completed',
+                'request': claimed_marker['request'],
+                'response': result.model_dump()
+            }, IDEMPOTENCY_TTL_SECONDS):
+                print(f"⚠️ Idempotency-Key {claimed_key} changed hands before transfer {result.transaction_id} completed")
+        return result
         
+    except HTTPException:
+        if claimed_key:
+            await store_call(idempotency_store.delete_if, claimed_key, claimed_marker)
+        raise
     except Exception as e:
         print(f"❌ Transfer execution error: {e}")
+        if claimed_key:
+            await store_call(idempotency_store.delete_if, claimed_key, claimed_marker)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if heartbeat:
+            heartbeat.cancel()
+
+@app.get("/transfer/status/{transaction_id}", response_model=TransferStatusResponse)
+async def get_transfer_status(transaction_id: str, user_token: dict = Depends(verify_firebase_token)):
+    """Progress of a transfer submitted with ?mode=async"""
+    job = await blocking_io.run(transfer_queue.get, transaction_id)
+    # Other users' transfers are reported as missing rather than forbidden
+    if job is None or job['user_id'] != user_token['uid']:
+        raise HTTPException(status_code=404, detail="Transfer not found")
+    return TransferStatusResponse(
+        transaction_id=transaction_id,
+        status=job['status'],
+        attempts=job['attempts'],
+        queued_at=datetime.fromtimestamp(job['created_at']).isoformat(),
+        updated_at=datetime.fromtimestamp(job['updated_at']).isoformat(),
+        error=job['error'],
+        result=TransferExecuteResponse(**job['result']) if job['result'] else None
+    )
+
+@app.websocket("/ws/updates")
+async def stream_user_updates(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """Push the caller's balance deltas and transfer status changes
+
+    Browsers cannot set headers on a WebSocket, so the ID token may also be passed as ?token=.
+    The socket is closed (1008, "Token expired") when the token expires; reconnect with a fresh one.
+    Events: {"type": "balance", "currency", "delta", "transaction_id"},
+    {"type": "transfer_status", "transaction_id", "status", "error"} and
+    {"type": "resync"} when the client fell behind and should refetch /user/me.
+    """
+    authorization = websocket.headers.get('authorization') or (f"Bearer {token}" if token else None)
+    try:
+        user_token = await verify_firebase_token(authorization)
+    except HTTPException:
+        await websocket.close(code=1008, reason="Invalid token")
+        return
+    
+    user_id = user_token['uid']
+    # Mock tokens carry no exp and stay open
+    token_lifetime = user_token['exp'] - time.time() if 'exp' in user_token else None
+    queue = update_hub.subscribe(user_id)
+    if queue is None:
+        await websocket.close(code=1013)
+        return
+    
+    async def forward_events():
+        try:
+            while True:
+                await websocket.send_text(json.dumps(await queue.get()))
+        except Exception:
+            # The socket closed mid-send; the receive loop below notices the disconnect
+            pass
+    
+    async def wait_for_disconnect():
+        # Nothing is expected from the client; this only waits for the socket to close
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+    
+    await websocket.accept()
+    sender = asyncio.create_task(forward_events())
+    try:
+        await asyncio.wait_for(wait_for_disconnect(), timeout=token_lifetime)
+    except asyncio.TimeoutError:
+        # Stop pushing balances on a token that is no longer valid
+        sender.cancel()
+        await websocket.close(code=1008, reason="Token expired")
+    finally:
+        sender.cancel()
+        update_hub.unsubscribe(user_id, queue)
+
+def load_or_create_user(user_token: dict) -> Dict[str, Any]:
+    """Read the caller's user document, creating it on first visit (blocking Firestore I/O)"""
+    user_id = user_token['uid']
+    user_data = read_user_with_balances(user_id)
+    if user_data is not None:
+        return user_data
+    
+    # Create user if doesn't exist
+    user_data = {
+        'email': user_token.get('email', ''),
+        'displayName': user_token.get('name', ''),
+        'balances': {
+            'usd': 1000.0,
+            'mxn': 0.0,
+            'eur': 0.0,
+            'gbp': 0.0,
+            'jpy': 0.0,
+            'cad': 0.0,
+            'aud': 0.0
+        },
+        'createdAt': firestore.SERVER_TIMESTAMP
+    }
+    # Create the user and its email index entry together
+    batch = db.batch()
+    batch.set(db.collection('users').document(user_id), user_data)
+    if user_data['email']:
+        email_key = email_index_key(user_data['email'])
+        batch.set(db.collection('user_emails').document(email_key),
+                  {'uid': user_id, 'email': user_data['email']})
+    batch.commit()
+    if user_data['email']:
+        email_uid_cache.put(email_key, user_id)
+    return user_data
+
+# uid -> (UserResponse, ETag) for dashboard polling
+profile_cache = InMemoryExpiringStore(PROFILE_CACHE_TTL_SECONDS, PROFILE_CACHE_MAX_ENTRIES)
+
+def profile_etag(profile: UserResponse) -> str:
+    payload = json.dumps(profile.model_dump(), sort_keys=True, separators=(',', ':'))
+    return '"' + hashlib.sha256(payload.encode()).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 9110 weak comparison against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
 
 @app.get("/user/me", response_model=UserResponse)
-async def get_user_profile(user_token: dict = Depends(verify_firebase_token)):
-    """Get current user's profile and balances"""
+async def get_user_profile(
+    response: Response,
+    user_token: dict = Depends(verify_firebase_token),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """Get current user's profile and balances
+
+    Served from a short-lived per-user cache. The response carries an ETag;
+    polling with If-None-Match gets 304 and no body while nothing changed.
+    """
     try:
-        if not db:
+        cached = profile_cache.get(user_token['uid']) if db else None
+        if cached:
+            profile, etag = cached
+        elif not db:
             # Return mock data when Firebase is not available
-            return UserResponse(
+            profile = UserResponse(
                 email=user_token.get('email', 'test@example.com'),
                 display_name=user_token.get('displayName', 'Test User'),
                 balances={
@@ -708,80 +3088,178 @@ async def get_user_profile(user_token: dict = Depends(verify_firebase_token)):
                     'aud': 0.0
                 }
             )
-        
-        user_id = user_token['uid']
-        user_doc = db.collection('users').document(user_id).get()
-        
-        # Check if user document exists
-        if not user_doc.exists:
-            # Create user if doesn't exist
-            user_data = {
-                'email': user_token.get('email', ''),
-                'displayName': user_token.get('name', ''),
-                'balances': {
-                    'usd': 1000.0,
-                    'mxn': 0.0,
-                    'eur': 0.0,
-                    'gbp': 0.0,
-                    'jpy': 0.0,
-                    'cad': 0.0,
-                    'aud': 0.0
-                },
-                'createdAt': firestore.SERVER_TIMESTAMP
-            }
-            db.collection('users').document(user_id).set(user_data)
-            return UserResponse(
-                email=user_data['email'],
-                display_name=user_data['displayName'],
-                balances=user_data['balances']
+            etag = profile_etag(profile)
+        else:
+            user_data = await blocking_io.run(load_or_create_user, user_token)
+            created_at = user_data.get('createdAt')
+            profile = UserResponse(
+                email=user_data.get('email', ''),
+                display_name=user_data.get('displayName', ''),
+                balances=user_data.get('balances', {}),
+                # A just-created user still holds the SERVER_TIMESTAMP sentinel
+                created_at=created_at.isoformat() if isinstance(created_at, datetime) else None
             )
+            etag = profile_etag(profile)
+            profile_cache.put(user_token['uid'], (profile, etag))
         
-        user_data = user_doc.to_dict()
-        
-        return UserResponse(
-            email=user_data.get('email', ''),
-            display_name=user_data.get('displayName', ''),
-            balances=user_data.get('balances', {})
-        )
+        # Browsers must revalidate, so balances never come from a stale HTTP cache
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return profile
         
     except Exception as e:
         print(f"❌ User profile error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Only the fields TransactionResponse needs; crypto_path and route_options stay in Firestore
+HISTORY_FIELDS = [
+    'sender_id', 'receiver_email', 'sent_amount', 'sent_currency',
+    'received_amount', 'received_currency', 'rate', 'timestamp'
+]
+
+def load_transfer_history(user_id: str, page_size: int, cursor: Optional[str]) -> Tuple[List[TransactionResponse], Optional[str]]:
+    """Read one page of the transfers the caller sent or received, newest first (blocking Firestore I/O)
+
+    Sent and received transfers are two queries merged on timestamp. Requires composite
+    indexes on transactions (sender_id ASC, timestamp DESC) and (receiver_id ASC, timestamp DESC).
+    Transfers recorded before receiver_id was stored only show up for their sender.
+    The cursor is the id of the last transaction on the previous page.
+    """
+    cursor_doc = None
+    if cursor:
+        cursor_doc = db.collection('transactions').document(cursor).get(
+            field_paths=['sender_id', 'receiver_id', 'timestamp']
+        )
+        cursor_data = cursor_doc.to_dict() if cursor_doc.exists else {}
+        if user_id not in (cursor_data.get('sender_id'), cursor_data.get('receiver_id')):
+            raise HTTPException(status_code=400, detail="Invalid history cursor")
+    
+    docs = {}
+    for party in ('sender_id', 'receiver_id'):
+        query = (
+            db.collection('transactions')
+            .where(party, '==', user_id)
+            .order_by('timestamp', direction=firestore.Query.DESCENDING)
+            .select(HISTORY_FIELDS)
+            .limit(page_size + 1)
+        )
+        if cursor_doc is not None:
+            # The cursor's timestamp positions both queries, whichever side it came from
+            query = query.start_after(cursor_doc)
+        # Keyed by id so a transfer to oneself is listed once
+        docs.update((doc.id, doc) for doc in query.stream())
+    
+    # Same order Firestore uses within each query: timestamp, then document id, descending
+    merged = sorted(docs.values(), key=lambda doc: (doc.to_dict().get('timestamp'), doc.id), reverse=True)
+    page = merged[:page_size]
+    next_cursor = page[-1].id if len(merged) > page_size else None
+    
+    transactions = []
+    for doc in page:
+        data = doc.to_dict()
+        timestamp = data.get('timestamp')
+        transactions.append(TransactionResponse(
+            transaction_id=doc.id,
+            sender_id=data.get('sender_id', ''),
+            receiver_email=data.get('receiver_email', ''),
+            sent_amount=data.get('sent_amount', 0),
+            sent_currency=data.get('sent_currency', ''),
+            received_amount=data.get('received_amount', 0),
+            received_currency=data.get('received_currency', ''),
+            rate=data.get('rate', 0),
+            timestamp=timestamp.isoformat() if hasattr(timestamp, 'isoformat') else str(timestamp or '')
+        ))
+    return transactions, next_cursor
+
 @app.get("/transfer/history", response_model=List[TransactionResponse])
-async def get_transfer_history(user_token: dict = Depends(verify_firebase_token)):
-    """Get user's transaction history"""
+async def get_transfer_history(
+    response: Response,
+    limit: int = Query(HISTORY_DEFAULT_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
+    user_token: dict = Depends(verify_firebase_token)
+):
+    """Get user's transaction history (sent and received), one page at a time
+
+    Received transfers are the ones whose sender_id is not the caller. The next page's cursor is returned in the X-Next-Cursor header (absent on the last page).
+    """
     try:
-        # For development/testing, always return mock data
-        return [
-            TransactionResponse(
-                transaction_id="mock-tx-1",
-                sender_id="test-user-123",
-                receiver_email="friend@example.com",
-                sent_amount=100.0,
-                sent_currency="USD",
-                received_amount=2000.0,
-                received_currency="MXN",
-                rate=20.0,
-                timestamp="2024-10-15T10:30:00Z"
-            ),
-            TransactionResponse(
-                transaction_id="mock-tx-2",
-                sender_id="test-user-123",
-                receiver_email="family@example.com",
-                sent_amount=50.0,
-                sent_currency="USD",
-                received_amount=45.0,
-                received_currency="EUR",
-                rate=0.9,
-                timestamp="2024-10-14T15:45:00Z"
-            )
-        ]
+        if not db:
+            # Return mock data when Firebase is not available
+            return [
+                TransactionResponse(
+                    transaction_id="mock-tx-1",
+                    sender_id="test-user-123",
+                    receiver_email="friend@example.com",
+                    sent_amount=100.0,
+                    sent_currency="USD",
+                    received_amount=2000.0,
+                    received_currency="MXN",
+                    rate=20.0,
+                    timestamp="2024-10-15T10:30:00Z"
+                ),
+                TransactionResponse(
+                    transaction_id="mock-tx-2",
+                    sender_id="test-user-123",
+                    receiver_email="family@example.com",
+                    sent_amount=50.0,
+                    sent_currency="USD",
+                    received_amount=45.0,
+                    received_currency="EUR",
+                    rate=0.9,
+                    timestamp="2024-10-14T15:45:00Z"
+                )
+            ]
         
+        page_size = min(limit, HISTORY_MAX_PAGE_SIZE)
+        transactions, next_cursor = await blocking_io.run(
+            load_transfer_history, user_token['uid'], page_size, cursor
+        )
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return transactions
+        
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Transaction history error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/batching/reports")
+async def get_batching_reports():
+    """Open batching windows, per-corridor realized savings rates and recent batch reports"""
+    return transfer_batching.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Upstream latency and error metrics plus cache hit ratios in Prometheus text format"""
+    caches = {'fx_rate': (fx_rate_cache.hits, fx_rate_cache.misses)}
+    for name, store in (('quote', quote_store), ('token', verified_token_cache), ('email_uid', email_uid_cache), ('profile', profile_cache)):
+        # Counters only; stats() would count rows in a shared store
+        caches[name] = (store.hits, store.misses)
+    return PlainTextResponse(upstream_metrics.render(caches), media_type="text/plain; version=0.0.4")
+
+@app.get("/livez")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {
+        "status": "alive",
+        "import_time_ms": round(import_time_seconds * 1000, 1),
+        "import_time_budget_ms": IMPORT_TIME_BUDGET_SECONDS * 1000
+    }
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe: startup has finished and the app can take traffic"""
+    if not app_ready:
+        raise HTTPException(status_code=503, detail="Starting up")
+    return {
+        "status": "ready",
+        "firebase": "active" if db else "inactive",
+        "stripe": "active" if stripe_enabled else "inactive"
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -793,9 +3271,26 @@ async def health_check():
             "cex_service": "active",
             "dex_service": "active",
             "firebase": "active" if db else "inactive"
-        }
+        },
+        "quote_store": await store_call(quote_store.stats),
+        "idempotency_store": await store_call(idempotency_store.stats),
+        "transfer_queue": await blocking_io.run(transfer_queue.stats),
+        "update_hub": update_hub.stats(),
+        "token_cache": verified_token_cache.stats(),
+        "email_uid_cache": email_uid_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "blocking_io": blocking_io.stats(),
+        "warm_corridor_age_seconds": corridor_prewarmer.stats(),
+        "batching_open_windows": transfer_batching.stats()['open_windows'],
+        "quote_coalescing": quote_coalescer.stats(),
+        "circuit_breakers": {provider: breaker.stats() for provider, breaker in circuit_breakers.items()},
+        "hedging": upstream_hedger.stats()
     }
 
+import_time_seconds = time.perf_counter() - _import_started
+if import_time_seconds > IMPORT_TIME_BUDGET_SECONDS:
+    print(f"⚠️ Importing the backend took {import_time_seconds:.2f}s (budget {IMPORT_TIME_BUDGET_SECONDS:.2f}s)")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -5,23 +5,32 @@ Integrates with Coinbase Advanced Trade API and Binance API for fiat-to-crypto o
 """
 
 import requests
+import aiohttp
+import asyncio
 import json
 import hmac
 import hashlib
 import time
 import base64
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+_env_loaded = False
+
+def load_environment():
+    """Load .env once, when the first client needs its keys rather than at import"""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
 
 class CoinbaseAdvancedTradeAPI:
     """Coinbase Advanced Trade API integration"""
     
     def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None):
+        load_environment()
         self.api_key = api_key or os.getenv('COINBASE_API_KEY')
         self.api_secret = api_secret or os.getenv('COINBASE_API_SECRET')
         self.base_url = "https://api.coinbase.com/api/v3/brokerage"
@@ -55,20 +64,73 @@ class CoinbaseAdvancedTradeAPI:
         
         return f"{self.api_key}:{timestamp}:{signature}"
     
+    # Request building and response parsing below are shared with AsyncCoinbaseAdvancedTradeAPI
+    
+    def _product_quote_request(self, product_id: str, side: str, amount: str) -> Tuple[str, Dict, Dict]:
+        """URL, headers and JSON body for an order quote"""
+        url = f"{self.base_url}/orders/quote"
+        headers = {
+            'Authorization': f'Bearer {self._generate_jwt_token("POST", "/api/v3/brokerage/orders/quote")}',
+            'Content-Type': 'application/json'
+        }
+        data = {
+            'product_id': product_id,
+            'side': side,
+            'amount': amount
+        }
+        return url, headers, data
+    
+    def _market_data_request(self, product_id: str) -> Tuple[str, Dict]:
+        """URL and headers for an authenticated ticker request"""
+        url = f"{self.base_url}/products/{product_id}/ticker"
+        headers = {
+            'Authorization': f'Bearer {self._generate_jwt_token("GET", f"/api/v3/brokerage/products/{product_id}/ticker")}',
+            'Content-Type': 'application/json'
+        }
+        return url, headers
+    
+    @staticmethod
+    def _public_market_data_url(product_id: str) -> str:
+        return f"https://api.exchange.coinbase.com/products/{product_id}/ticker"
+    
+    @staticmethod
+    def _parse_public_market_data(data: Dict) -> Dict:
+        return {
+            'price': data.get('price'),
+            'bid': data.get('bid'),
+            'ask': data.get('ask'),
+            'volume': data.get('volume')
+        }
+    
+    @staticmethod
+    def _fiat_to_crypto_quote(fiat_amount: float, fiat_currency: str, crypto_currency: str,
+                              product_id: str, market_data: Optional[Dict]) -> Optional[Dict]:
+        """Price a fiat-to-crypto conversion from ticker data, or None without a usable price"""
+        if not market_data:
+            return None
+        
+        # Calculate crypto amount
+        price = float(market_data.get('price', 0))
+        if price == 0:
+            return None
+        
+        crypto_amount = fiat_amount / price
+        
+        return {
+            'exchange': 'coinbase',
+            'fiat_amount': fiat_amount,
+            'fiat_currency': fiat_currency,
+            'crypto_currency': crypto_currency,
+            'crypto_amount': crypto_amount,
+            'rate': price,
+            'product_id': product_id,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def get_product_quote(self, product_id: str, side: str = "buy", amount: str = "100") -> Optional[Dict]:
         """Get quote for a product (fiat-to-crypto or crypto-to-fiat)"""
         try:
-            url = f"{self.base_url}/orders/quote"
-            headers = {
-                'Authorization': f'Bearer {self._generate_jwt_token("POST", "/api/v3/brokerage/orders/quote")}',
-                'Content-Type': 'application/json'
-            }
-            
-            data = {
-                'product_id': product_id,
-                'side': side,
-                'amount': amount
-            }
+            url, headers, data = self._product_quote_request(product_id, side, amount)
             
             response = requests.post(url, headers=headers, json=data, timeout=10)
             
@@ -85,11 +147,7 @@ class CoinbaseAdvancedTradeAPI:
     def get_market_data(self, product_id: str) -> Optional[Dict]:
         """Get market data for a product"""
         try:
-            url = f"{self.base_url}/products/{product_id}/ticker"
-            headers = {
-                'Authorization': f'Bearer {self._generate_jwt_token("GET", f"/api/v3/brokerage/products/{product_id}/ticker")}',
-                'Content-Type': 'application/json'
-            }
+            url, headers = self._market_data_request(product_id)
             
             response = requests.get(url, headers=headers, timeout=10)
             
@@ -106,17 +164,10 @@ class CoinbaseAdvancedTradeAPI:
     def _get_public_market_data(self, product_id: str) -> Optional[Dict]:
         """Get public market data (no auth required)"""
         try:
-            url = f"https://api.exchange.coinbase.com/products/{product_id}/ticker"
-            response = requests.get(url, timeout=10)
+            response = requests.get(self._public_market_data_url(product_id), timeout=10)
             
             if response.status_code == 200:
-                data = response.json()
-                return {
-                    'price': data.get('price'),
-                    'bid': data.get('bid'),
-                    'ask': data.get('ask'),
-                    'volume': data.get('volume')
-                }
+                return self._parse_public_market_data(response.json())
             return None
             
         except requests.exceptions.RequestException as e:
@@ -126,34 +177,14 @@ class CoinbaseAdvancedTradeAPI:
     def get_fiat_to_crypto_quote(self, fiat_amount: float, fiat_currency: str, crypto_currency: str) -> Optional[Dict]:
         """Get quote for fiat to crypto conversion"""
         product_id = f"{crypto_currency}-{fiat_currency}"
-        
-        # Get market data
         market_data = self.get_market_data(product_id)
-        if not market_data:
-            return None
-        
-        # Calculate crypto amount
-        price = float(market_data.get('price', 0))
-        if price == 0:
-            return None
-        
-        crypto_amount = fiat_amount / price
-        
-        return {
-            'exchange': 'coinbase',
-            'fiat_amount': fiat_amount,
-            'fiat_currency': fiat_currency,
-            'crypto_currency': crypto_currency,
-            'crypto_amount': crypto_amount,
-            'rate': price,
-            'product_id': product_id,
-            'timestamp': datetime.now().isoformat()
-        }
+        return self._fiat_to_crypto_quote(fiat_amount, fiat_currency, crypto_currency, product_id, market_data)
 
 class BinanceAPI:
     """Binance API integration"""
     
     def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None):
+        load_environment()
         self.api_key = api_key or os.getenv('BINANCE_API_KEY')
         self.api_secret = api_secret or os.getenv('BINANCE_API_SECRET')
         self.base_url = "https://api.binance.com"
@@ -180,11 +211,54 @@ class BinanceAPI:
             hashlib.sha256
         ).hexdigest()
     
+    # Request building and response parsing below are shared with AsyncBinanceAPI
+    
+    def _ticker_price_request(self, symbol: str) -> Tuple[str, Dict]:
+        return f"{self.base_url}/api/v3/ticker/price", {'symbol': symbol}
+    
+    def _order_book_request(self, symbol: str, limit: int) -> Tuple[str, Dict]:
+        return f"{self.base_url}/api/v3/depth", {'symbol': symbol, 'limit': limit}
+    
+    @staticmethod
+    def _symbol(fiat_currency: str, crypto_currency: str) -> str:
+        # Binance uses different symbol format
+        if fiat_currency == 'USD':
+            return f"{crypto_currency}USDT"  # Use USDT as USD proxy
+        return f"{crypto_currency}{fiat_currency}"
+    
+    @staticmethod
+    def _fiat_to_crypto_quote(fiat_amount: float, fiat_currency: str, crypto_currency: str, symbol: str,
+                              ticker: Optional[Dict], order_book: Optional[Dict]) -> Optional[Dict]:
+        """Price a fiat-to-crypto conversion from the ticker and order book, or None without a usable price"""
+        if not ticker:
+            return None
+        
+        price = float(ticker.get('price', 0))
+        if price == 0:
+            return None
+        
+        # Use ask price for buying (fiat to crypto)
+        if order_book and 'asks' in order_book and order_book['asks']:
+            ask_price = float(order_book['asks'][0][0])
+            price = ask_price
+        
+        crypto_amount = fiat_amount / price
+        
+        return {
+            'exchange': 'binance',
+            'fiat_amount': fiat_amount,
+            'fiat_currency': fiat_currency,
+            'crypto_currency': crypto_currency,
+            'crypto_amount': crypto_amount,
+            'rate': price,
+            'symbol': symbol,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def get_ticker_price(self, symbol: str) -> Optional[Dict]:
         """Get ticker price for a symbol"""
         try:
-            url = f"{self.base_url}/api/v3/ticker/price"
-            params = {'symbol': symbol}
+            url, params = self._ticker_price_request(symbol)
             
             response = requests.get(url, params=params, timeout=10)
             
@@ -199,8 +273,7 @@ class BinanceAPI:
     def get_order_book(self, symbol: str, limit: int = 5) -> Optional[Dict]:
         """Get order book for a symbol"""
         try:
-            url = f"{self.base_url}/api/v3/depth"
-            params = {'symbol': symbol, 'limit': limit}
+            url, params = self._order_book_request(symbol, limit)
             
             response = requests.get(url, params=params, timeout=10)
             
@@ -214,11 +287,7 @@ class BinanceAPI:
     
     def get_fiat_to_crypto_quote(self, fiat_amount: float, fiat_currency: str, crypto_currency: str) -> Optional[Dict]:
         """Get quote for fiat to crypto conversion"""
-        # Binance uses different symbol format
-        if fiat_currency == 'USD':
-            symbol = f"{crypto_currency}USDT"  # Use USDT as USD proxy
-        else:
-            symbol = f"{crypto_currency}{fiat_currency}"
+        symbol = self._symbol(fiat_currency, crypto_currency)
         
         # Get ticker price
         ticker = self.get_ticker_price(symbol)
@@ -228,27 +297,7 @@ class BinanceAPI:
         # Get order book for better pricing
         order_book = self.get_order_book(symbol)
         
-        price = float(ticker.get('price', 0))
-        if price == 0:
-            return None
-        
-        # Use ask price for buying (fiat to crypto)
-        if order_book and 'asks' in order_book and order_book['asks']:
-            ask_price = float(order_book['asks'][0][0])
-            price = ask_price
-        
-        crypto_amount = fiat_amount / price
-        
-        return {
-            'exchange': 'binance',
-            'fiat_amount': fiat_amount,
-            'fiat_currency': fiat_currency,
-            'crypto_currency': crypto_currency,
-            'crypto_amount': crypto_amount,
-            'rate': price,
-            'symbol': symbol,
-            'timestamp': datetime.now().isoformat()
-        }
+        return self._fiat_to_crypto_quote(fiat_amount, fiat_currency, crypto_currency, symbol, ticker, order_book)
 
 class CEXAggregatorService:
     """Service to aggregate quotes from multiple CEX APIs"""
@@ -386,6 +435,202 @@ class CEXAggregatorService:
             # Default rate
             return crypto_amount * 0.85  # Assume 0.85 rate for unknown pairs
 
+# (provider, make_call) -> result of make_call(), possibly racing a duplicate call
+RequestHedger = Callable[[str, Callable[[], Awaitable[Any]]], Awaitable[Any]]
+
+class AsyncHTTPClientMixin:
+    """Shared aiohttp plumbing for the asyncio-native exchange clients"""
+    
+    # Provider name passed to the hedger so each exchange keeps its own latency profile
+    provider_name = 'exchange'
+    
+    def _init_http(self, session_provider: Optional[Callable[[str], aiohttp.ClientSession]] = None,
+                   timeout: float = 10, hedger: Optional[RequestHedger] = None):
+        # session_provider maps a URL to a long-lived pooled session (e.g. the backend's per-host pool)
+        self.session_provider = session_provider
+        # hedger, if given, may duplicate slow GETs (they are idempotent) and keep the first answer
+        self.hedger = hedger
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._own_session: Optional[aiohttp.ClientSession] = None
+    
+    def _session(self, url: str) -> aiohttp.ClientSession:
+        if self.session_provider:
+            return self.session_provider(url)
+        if self._own_session is None or self._own_session.closed:
+            self._own_session = aiohttp.ClientSession()
+        return self._own_session
+    
+    async def _request_json(self, method: str, url: str, **kwargs) -> Tuple[int, Any]:
+        """Send a request and return (status, parsed JSON body or text)"""
+        if method == 'GET' and self.hedger:
+            return await self.hedger(self.provider_name, lambda: self._send_request(method, url, **kwargs))
+        return await self._send_request(method, url, **kwargs)
+    
+    async def _send_request(self, method: str, url: str, **kwargs) -> Tuple[int, Any]:
+        async with self._session(url).request(method, url, timeout=self.timeout, **kwargs) as response:
+            if response.status == 200:
+                return response.status, await response.json(content_type=None)
+            return response.status, await response.text()
+    
+    async def close(self):
+        """Close the client's own session (pooled sessions are owned by the provider)"""
+        if self._own_session and not self._own_session.closed:
+            await self._own_session.close()
+
+class AsyncCoinbaseAdvancedTradeAPI(AsyncHTTPClientMixin, CoinbaseAdvancedTradeAPI):
+    """Coinbase Advanced Trade API integration on a shared aiohttp session"""
+    
+    provider_name = 'coinbase'
+    
+    def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None,
+                 session_provider: Optional[Callable[[str], aiohttp.ClientSession]] = None,
+                 hedger: Optional[RequestHedger] = None):
+        super().__init__(api_key, api_secret)
+        self._init_http(session_provider, hedger=hedger)
+    
+    async def get_product_quote(self, product_id: str, side: str = "buy", amount: str = "100") -> Optional[Dict]:
+        """Get quote for a product (fiat-to-crypto or crypto-to-fiat)"""
+        try:
+            url, headers, data = self._product_quote_request(product_id, side, amount)
+            
+            status, body = await self._request_json('POST', url, headers=headers, json=data)
+            
+            if status == 200:
+                return body
+            else:
+                print(f"Coinbase API error: {status} - {body}")
+                return None
+                
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Coinbase API request error: {e}")
+            return None
+    
+    async def get_market_data(self, product_id: str) -> Optional[Dict]:
+        """Get market data for a product"""
+        try:
+            url, headers = self._market_data_request(product_id)
+            
+            status, body = await self._request_json('GET', url, headers=headers)
+            
+            if status == 200:
+                return body
+            else:
+                # Fallback to public API
+                return await self._get_public_market_data(product_id)
+                
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Coinbase market data error: {e}")
+            return await self._get_public_market_data(product_id)
+    
+    async def _get_public_market_data(self, product_id: str) -> Optional[Dict]:
+        """Get public market data (no auth required)"""
+        try:
+            status, data = await self._request_json('GET', self._public_market_data_url(product_id))
+            
+            if status == 200:
+                return self._parse_public_market_data(data)
+            return None
+            
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Coinbase public API error: {e}")
+            return None
+    
+    async def get_fiat_to_crypto_quote(self, fiat_amount: float, fiat_currency: str, crypto_currency: str) -> Optional[Dict]:
+        """Get quote for fiat to crypto conversion"""
+        product_id = f"{crypto_currency}-{fiat_currency}"
+        market_data = await self.get_market_data(product_id)
+        return self._fiat_to_crypto_quote(fiat_amount, fiat_currency, crypto_currency, product_id, market_data)
+
+class AsyncBinanceAPI(AsyncHTTPClientMixin, BinanceAPI):
+    """Binance API integration on a shared aiohttp session"""
+    
+    provider_name = 'binance'
+    
+    def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None,
+                 session_provider: Optional[Callable[[str], aiohttp.ClientSession]] = None,
+                 hedger: Optional[RequestHedger] = None):
+        super().__init__(api_key, api_secret)
+        self._init_http(session_provider, hedger=hedger)
+    
+    async def get_ticker_price(self, symbol: str) -> Optional[Dict]:
+        """Get ticker price for a symbol"""
+        try:
+            url, params = self._ticker_price_request(symbol)
+            
+            status, body = await self._request_json('GET', url, params=params)
+            
+            if status == 200:
+                return body
+            return None
+            
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Binance API error: {e}")
+            return None
+    
+    async def get_order_book(self, symbol: str, limit: int = 5) -> Optional[Dict]:
+        """Get order book for a symbol"""
+        try:
+            url, params = self._order_book_request(symbol, limit)
+            
+            status, body = await self._request_json('GET', url, params=params)
+            
+            if status == 200:
+                return body
+            return None
+            
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Binance order book error: {e}")
+            return None
+    
+    async def get_fiat_to_crypto_quote(self, fiat_amount: float, fiat_currency: str, crypto_currency: str) -> Optional[Dict]:
+        """Get quote for fiat to crypto conversion"""
+        symbol = self._symbol(fiat_currency, crypto_currency)
+        
+        # Ticker and order book are independent, so fetch them together
+        ticker, order_book = await asyncio.gather(
+            self.get_ticker_price(symbol),
+            self.get_order_book(symbol)
+        )
+        return self._fiat_to_crypto_quote(fiat_amount, fiat_currency, crypto_currency, symbol, ticker, order_book)
+
+class AsyncCEXAggregatorService:
+    """Asyncio-native counterpart of CEXAggregatorService for use inside an event loop"""
+    
+    def __init__(self, session_provider: Optional[Callable[[str], aiohttp.ClientSession]] = None,
+                 hedger: Optional[RequestHedger] = None):
+        self.coinbase = AsyncCoinbaseAdvancedTradeAPI(session_provider=session_provider, hedger=hedger)
+        self.binance = AsyncBinanceAPI(session_provider=session_provider, hedger=hedger)
+        
+        # Supported crypto currencies for on-ramp
+        self.supported_cryptos = ['BTC', 'ETH', 'USDC', 'USDT', 'DAI']
+    
+    async def get_fiat_to_crypto_quotes(self, fiat_amount: float, fiat_currency: str, 
+                                        crypto_currency: str) -> Dict:
+        """Get quotes from multiple CEX APIs concurrently for fiat to crypto conversion"""
+        coinbase_quote, binance_quote = await asyncio.gather(
+            self.coinbase.get_fiat_to_crypto_quote(fiat_amount, fiat_currency, crypto_currency),
+            self.binance.get_fiat_to_crypto_quote(fiat_amount, fiat_currency, crypto_currency)
+        )
+        quotes = {}
+        if coinbase_quote:
+            quotes['coinbase'] = coinbase_quote
+        if binance_quote:
+            quotes['binance'] = binance_quote
+        
+        best_quote = max(quotes.values(), key=lambda quote: quote['crypto_amount'], default=None)
+        
+        return {
+            'fiat_amount': fiat_amount,
+            'fiat_currency': fiat_currency,
+            'crypto_currency': crypto_currency,
+            'quotes': quotes,
+            'best_quote': best_quote,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    async def close(self):
+        await asyncio.gather(self.coinbase.close(), self.binance.close())
+
 class CEXTransactionDisplay:
     """Display CEX integration results in human-readable format"""
     
@@ -13,13 +13,20 @@ import os
 from dotenv import load_dotenv
 from dex_aggregator import DEXAggregatorService, DEXTransactionDisplay
 
-# Load environment variables
-load_dotenv()
+_env_loaded = False
+
+def load_environment():
+    """Load .env the first time an FX client is created"""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
 
 class FXRateService:
     """Service to fetch real-time FX rates from ExchangeRate API"""
     
     def __init__(self, api_key: Optional[str] = None):
+        load_environment()
         self.api_key = api_key or os.getenv('EXCHANGERATE_API_KEY')
         self.base_url = "https://v6.exchangerate-api.com/v6"
         
@@ -2,9 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import styled from 'styled-components';
 import { useAuth } from '../contexts/AuthContext';
 import { useNavigate } from 'react-router-dom';
-import { transactionAPI } from '../services/api';
-import { doc, getDoc } from 'firebase/firestore';
-import { db } from '../config/firebase';
+import { transactionAPI, updatesAPI, userAPI } from '../services/api';
 import toast from 'react-hot-toast';
 import QuickConverter from '../components/QuickConverter';
 
@@ -417,6 +415,7 @@ const TwooDashboard = () => {
   const [transactions, setTransactions] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [balancesError, setBalancesError] = useState(null);
 
   const overviewRef = useRef(null);
   const convertRef = useRef(null);
@@ -427,23 +426,28 @@ const TwooDashboard = () => {
     try {
       setLoading(true);
       setError(null);
+      setBalancesError(null);
 
       if (!currentUser) {
         throw new Error('User not authenticated');
       }
 
-      // Fetch user data from Firestore
-      const userDocRef = doc(db, 'users', currentUser.uid);
-      const userDoc = await getDoc(userDocRef);
-      
-      if (userDoc.exists()) {
-        const userData = userDoc.data();
+      const token = await currentUser.getIdToken();
+
+      // Balances come from the backend: users/{uid}.balances in Firestore is only the
+      // compacted snapshot and misses transfers still in the ledger
+      try {
+        const profile = await userAPI.getUserProfile(token, { quiet: true });
         setUserProfile({
-          ...userData,
-          createdAt: userData.createdAt?.toDate?.() || new Date(userData.createdAt)
+          displayName: profile.display_name,
+          email: profile.email,
+          balances: profile.balances,
+          createdAt: profile.created_at ? new Date(profile.created_at) : new Date()
         });
-      } else {
-        // Fallback to currentUser data
+      } catch (profileError) {
+        // Fallback to currentUser data; the balances card says why it is empty
+        console.warn('Backend API unavailable, balances not loaded:', profileError);
+        setBalancesError(`Couldn't load your balances (${profileError.message}). Refresh to try again.`);
         setUserProfile({
           displayName: currentUser.displayName || 'User',
           email: currentUser.email,
@@ -453,7 +457,6 @@ const TwooDashboard = () => {
 
       // Try to load transaction history from backend
       try {
-        const token = await currentUser.getIdToken();
         const history = await transactionAPI.getTransactionHistory(token);
         setTransactions(history.slice(0, 5)); // Show only recent 5 transactions
       } catch (apiError) {
@@ -493,6 +496,39 @@ const TwooDashboard = () => {
     }
   }, [currentUser, loadDashboardData]);
 
+  // Refetch balances without the full-page loading state, after missed push updates
+  const refreshBalances = React.useCallback(async () => {
+    try {
+      const token = await currentUser.getIdToken();
+      const profile = await userAPI.getUserProfile(token, { quiet: true });
+      setUserProfile(current => ({ ...current, balances: profile.balances }));
+      setBalancesError(null);
+    } catch (err) {
+      console.warn('Balance refresh failed:', err);
+    }
+  }, [currentUser]);
+
+  // Apply pushed balance deltas as transfers settle
+  useEffect(() => {
+    if (!currentUser) {
+      return undefined;
+    }
+    const subscription = updatesAPI.subscribe(() => currentUser.getIdToken(), (event) => {
+      if (event.type === 'balance') {
+        setUserProfile(current => (current?.balances ? {
+          ...current,
+          balances: {
+            ...current.balances,
+            [event.currency]: (current.balances[event.currency] || 0) + event.delta
+          }
+        } : current));
+      } else if (event.type === 'resync') {
+        refreshBalances();
+      }
+    });
+    return () => subscription.close();
+  }, [currentUser, refreshBalances]);
+
   const displayName = userProfile?.displayName || currentUser?.displayName || currentUser?.email || 'User';
   const email = userProfile?.email || currentUser?.email || '—';
   const initials = (displayName || email || 'U')
@@ -690,7 +726,7 @@ const TwooDashboard = () => {
                   ))}
                 </BalanceGrid>
               ) : (
-                <ErrorState>No balances available.</ErrorState>
+                <ErrorState>{balancesError || 'No balances available.'}</ErrorState>
               )}
             </Card>
 
@@ -96,8 +96,8 @@ export const transactionAPI = {
 };
 
 export const userAPI = {
-  // Get current user profile
-  getUserProfile: async (authToken) => {
+  // Get current user profile; quiet skips the error toast for callers that show their own error state
+  getUserProfile: async (authToken, { quiet = false } = {}) => {
     try {
       const response = await api.get('/user/me', {
         headers: {
@@ -107,12 +107,68 @@ export const userAPI = {
       return response.data;
     } catch (error) {
       const message = error.response?.data?.detail || 'Failed to get user profile';
-      toast.error(message);
+      if (!quiet) toast.error(message);
       throw new Error(message);
     }
   },
 };
 
+export const updatesAPI = {
+  // Open the push channel for balance and transfer status events; call close() on the result to stop.
+  // Reconnects after abnormal closes with exponential backoff; onEvent gets { type: 'resync' } after
+  // each reconnect, since events sent while disconnected are lost and the caller should refetch.
+  subscribe: (getAuthToken, onEvent) => {
+    let socket = null;
+    let stopped = false;
+    let retryTimer = null;
+    let attempts = 0;
+    let connected = false;
+    const scheduleReconnect = () => {
+      // 1s, 2s, 4s ... capped at 30s, with jitter so clients don't reconnect in lockstep
+      const delay = Math.min(1000 * 2 ** attempts, 30000) * (0.5 + Math.random() / 2);
+      attempts += 1;
+      retryTimer = setTimeout(connect, delay);
+    };
+    const connect = async () => {
+      retryTimer = null;
+      let authToken;
+      try {
+        authToken = await getAuthToken();
+      } catch (error) {
+        console.error('❌ Updates socket could not get a token:', error);
+        if (!stopped) scheduleReconnect();
+        return;
+      }
+      if (stopped) return;
+      socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/ws/updates?token=${encodeURIComponent(authToken)}`);
+      socket.onopen = () => {
+        attempts = 0;
+        if (connected) onEvent({ type: 'resync' });
+        connected = true;
+      };
+      socket.onmessage = (message) => onEvent(JSON.parse(message.data));
+      socket.onerror = () => console.error('❌ Updates socket error');
+      socket.onclose = (event) => {
+        if (stopped || event.code === 1000) return;
+        // The server closes the socket when the ID token expires; reconnect at once with a fresh one
+        if (event.code === 1008 && event.reason === 'Token expired') {
+          connect();
+        } else {
+          scheduleReconnect();
+        }
+      };
+    };
+    connect();
+    return {
+      close: () => {
+        stopped = true;
+        if (retryTimer) clearTimeout(retryTimer);
+        if (socket) socket.close();
+      },
+    };
+  },
+};
+
 export const healthAPI = {
   // Health check
   checkHealth: async () => {